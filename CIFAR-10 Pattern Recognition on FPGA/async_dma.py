@@ -0,0 +1,91 @@
+# Shared module: "CNN Image Classification on GPU and FPGA using ResNet-18 and ImageNet/src/run_inference_fpga.py"
+# imports this file instead of keeping a copy, so changes must work for both projects
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# asyncio front end for an AXI DMA. Transfers on one engine are serialised,
+# but the event loop stays free while they are in flight, so one process can
+# keep several requests (and several DMA engines) busy at once.
+class AsyncDMA:
+    def __init__(self, dma, use_interrupts=False, poll_interval=0.0002):
+        self.dma = dma
+        self.use_interrupts = use_interrupts
+        self.poll_interval = poll_interval
+        self.lock = None
+        self.pending = 0
+        self.completed = 0
+        self.busy_time = 0.0
+
+    async def channel_done(self, channel):
+        if self.use_interrupts:
+            await channel.wait_async()
+            return
+        while not channel.idle:
+            await asyncio.sleep(self.poll_interval)
+        channel.wait()
+
+    async def transfer(self, input_buffer, output_buffer, in_nbytes=0, out_nbytes=0):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        self.pending += 1
+        try:
+            async with self.lock:
+                start = time.perf_counter()
+                self.dma.sendchannel.transfer(input_buffer, nbytes=in_nbytes)
+                self.dma.recvchannel.transfer(output_buffer, nbytes=out_nbytes)
+                await self.channel_done(self.dma.sendchannel)
+                await self.channel_done(self.dma.recvchannel)
+                self.busy_time += time.perf_counter() - start
+                self.completed += 1
+        finally:
+            self.pending -= 1
+        return output_buffer
+
+    def submit(self, input_buffer, output_buffer, in_nbytes=0, out_nbytes=0):
+        return asyncio.ensure_future(self.transfer(input_buffer, output_buffer, in_nbytes, out_nbytes))
+
+# Classifies frames through one or more AsyncDMA engines. Each in-flight
+# request owns a buffer slot, so frame N+1 is preprocessed while frame N is
+# on the fabric. Slot buffers come from allocate_fn and are handed back to
+# release_fn (e.g. BufferPool.acquire/release) on close.
+class AsyncPredictor:
+    def __init__(self, engines, preprocess, allocate_fn, input_shape, num_classes, slots_per_engine=2,
+                 release_fn=None):
+        self.engines = engines
+        self.preprocess = preprocess
+        self.release_fn = release_fn
+        self.buffers = [(allocate_fn(shape=(1,) + tuple(input_shape), dtype=np.float32),
+                         allocate_fn(shape=(1, num_classes), dtype=np.float32))
+                        for _ in range(slots_per_engine * len(engines))]
+        self.free_slots = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def predict(self, image):
+        if self.free_slots is None:
+            self.free_slots = asyncio.Queue()
+            for slot in self.buffers:
+                self.free_slots.put_nowait(slot)
+        input_buffer, output_buffer = await self.free_slots.get()
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self.preprocess, image, input_buffer[0])
+            engine = min(self.engines, key=lambda e: e.pending)
+            await engine.transfer(input_buffer, output_buffer)
+            return int(np.argmax(output_buffer[0]))
+        finally:
+            self.free_slots.put_nowait((input_buffer, output_buffer))
+
+    async def predict_many(self, images):
+        return await asyncio.gather(*(self.predict(image) for image in images))
+
+    def close(self):
+        self.executor.shutdown()
+        for slot in self.buffers:
+            for buffer in slot:
+                if self.release_fn is not None:
+                    self.release_fn(buffer)
+                elif hasattr(buffer, 'freebuffer'):
+                    buffer.freebuffer()
+        self.buffers = []
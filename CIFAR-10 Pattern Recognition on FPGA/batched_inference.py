@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+# Gathers frames from one or more sources into a single (N,3,32,32) DMA
+# transfer so the fixed DMA setup cost is paid once per batch
+class BatchedPredictor:
+    def __init__(self, dma, buffer_pool, preprocess, max_batch=8, max_wait=0.005,
+                 input_shape=(3, 32, 32), num_classes=10):
+        self.dma = dma
+        self.buffer_pool = buffer_pool
+        self.preprocess = preprocess
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.frame_nbytes = int(np.prod(input_shape)) * np.dtype(np.float32).itemsize
+        self.input_buffer = buffer_pool.acquire((max_batch,) + tuple(input_shape), np.float32)
+        self.output_buffer = buffer_pool.acquire((max_batch, num_classes), np.float32)
+        self.requests = queue.Queue()
+        # predict_batch and the serve worker share the buffers and DMA channels
+        self.lock = threading.Lock()
+        self.worker = None
+        self.running = False
+        self.batches = 0
+        self.frames = 0
+
+    def run_batch(self, frames):
+        n = len(frames)
+        with self.lock:
+            for k, frame in enumerate(frames):
+                self.input_buffer[k] = self.preprocess(frame)
+
+            self.dma.sendchannel.transfer(self.input_buffer, nbytes=n * self.frame_nbytes)
+            self.dma.recvchannel.transfer(self.output_buffer, nbytes=n * self.output_buffer[0].nbytes)
+            self.dma.sendchannel.wait()
+            self.dma.recvchannel.wait()
+
+            self.batches += 1
+            self.frames += n
+            return np.argmax(self.output_buffer[:n], axis=1)
+
+    def predict_batch(self, frames):
+        predictions = []
+        for start in range(0, len(frames), self.max_batch):
+            predictions.append(self.run_batch(frames[start:start + self.max_batch]))
+        return np.concatenate(predictions) if predictions else np.empty(0, dtype=np.int64)
+
+    def submit(self, frame, source=None):
+        if not self.running:
+            raise RuntimeError("BatchedPredictor.start() must be called before submit()")
+        future = Future()
+        self.requests.put((frame, source, future))
+        return future
+
+    def start(self):
+        self.running = True
+        self.worker = threading.Thread(target=self.serve, daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        self.running = False
+        if self.worker is not None:
+            self.requests.put(None)
+            self.worker.join()
+            self.worker = None
+
+    def collect(self):
+        first = self.requests.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                self.requests.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def serve(self):
+        while True:
+            batch = self.collect()
+            if not batch:
+                return
+            try:
+                predictions = self.run_batch([frame for frame, _, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, source, future), prediction in zip(batch, predictions):
+                future.set_result((source, int(prediction)))
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'frames': self.frames,
+            'mean_batch_size': self.frames / self.batches if self.batches else 0.0
+        }
+
+    def close(self):
+        self.stop()
+        self.buffer_pool.release(self.input_buffer)
+        self.buffer_pool.release(self.output_buffer)
@@ -0,0 +1,77 @@
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+def software_allocate(shape, dtype=np.uint32):
+    # Stand-in for pynq.allocate when no board is attached
+    return np.zeros(shape, dtype=dtype)
+
+class BufferPool:
+    def __init__(self, allocate_fn=software_allocate):
+        self.allocate_fn = allocate_fn
+        self.free = {}
+        self.owned = {}
+        self.checked_out = set()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def key(self, shape, dtype):
+        if isinstance(shape, int):
+            shape = (shape,)
+        return tuple(shape), np.dtype(dtype).str
+
+    def acquire(self, shape, dtype=np.float32):
+        key = self.key(shape, dtype)
+        with self.lock:
+            free = self.free.setdefault(key, [])
+            if free:
+                self.hits += 1
+                buffer = free.pop()
+                self.checked_out.add(id(buffer))
+                return buffer
+            self.misses += 1
+        buffer = self.allocate_fn(shape=key[0], dtype=np.dtype(dtype))
+        with self.lock:
+            self.owned[id(buffer)] = (key, buffer)
+            self.checked_out.add(id(buffer))
+        return buffer
+
+    def release(self, buffer):
+        with self.lock:
+            if id(buffer) not in self.owned:
+                raise ValueError("Buffer was not allocated by this pool")
+            if id(buffer) not in self.checked_out:
+                raise ValueError("Buffer was released twice")
+            self.checked_out.remove(id(buffer))
+            key, _ = self.owned[id(buffer)]
+            self.free[key].append(buffer)
+
+    @contextmanager
+    def borrow(self, shape, dtype=np.float32):
+        buffer = self.acquire(shape, dtype)
+        try:
+            yield buffer
+        finally:
+            self.release(buffer)
+
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'allocated': len(self.owned),
+                'checked_out': len(self.checked_out),
+                'free': sum(len(free) for free in self.free.values())
+            }
+
+    def close(self):
+        with self.lock:
+            for _, buffer in self.owned.values():
+                if hasattr(buffer, 'freebuffer'):
+                    buffer.freebuffer()
+            self.owned.clear()
+            self.checked_out.clear()
+            self.free.clear()
@@ -4,8 +4,13 @@ import numpy as np
 from pynq.lib.video import *
 from pynq.lib.video.common import *
 import cv2
+from buffer_pool import BufferPool
+from batched_inference import BatchedPredictor
+from video_pipeline import VideoPipeline
+from async_dma import AsyncDMA, AsyncPredictor
 
 overlay = Overlay("cifar10_cnn.bit")
+buffer_pool = BufferPool(allocate)
 
 def preprocess_image(image):
     image = cv2.resize(image, (32, 32))
@@ -16,19 +21,43 @@ def preprocess_image(image):
 
 def predict(image):
     preprocessed = preprocess_image(image)
-    input_buffer = allocate(shape=(1, 3, 32, 32), dtype=np.float32)
-    output_buffer = allocate(shape=(1, 10), dtype=np.float32)
-    
-    input_buffer[0] = preprocessed
-    
-    dma = overlay.axi_dma_0
-    dma.sendchannel.transfer(input_buffer)
-    dma.recvchannel.transfer(output_buffer)
-    dma.sendchannel.wait()
-    dma.recvchannel.wait()
-    
-    result = output_buffer[0]
-    return np.argmax(result)
+    with buffer_pool.borrow((1, 3, 32, 32), np.float32) as input_buffer, \
+         buffer_pool.borrow((1, 10), np.float32) as output_buffer:
+        input_buffer[0] = preprocessed
+        
+        dma = overlay.axi_dma_0
+        dma.sendchannel.transfer(input_buffer)
+        dma.recvchannel.transfer(output_buffer)
+        dma.sendchannel.wait()
+        dma.recvchannel.wait()
+        
+        result = output_buffer[0]
+        return np.argmax(result)
+
+max_batch = 8
+max_wait = 0.005
+batched_predictor = None
+
+# The batching worker thread and its buffers are only set up on first use
+def predict_frames(frames):
+    global batched_predictor
+    if batched_predictor is None:
+        batched_predictor = BatchedPredictor(overlay.axi_dma_0, buffer_pool, preprocess_image,
+                                             max_batch=max_batch, max_wait=max_wait)
+    return batched_predictor.predict_batch(frames)
+
+def preprocess_into(image, out):
+    out[...] = preprocess_image(image)
+
+async_predictor = None
+
+async def predict_async(image):
+    global async_predictor
+    if async_predictor is None:
+        async_predictor = AsyncPredictor([AsyncDMA(overlay.axi_dma_0)], preprocess_into, buffer_pool.acquire,
+                                         input_shape=(3, 32, 32), num_classes=10,
+                                         release_fn=buffer_pool.release)
+    return await async_predictor.predict(image)
 
 frame_width = 640
 frame_height = 480
@@ -40,18 +69,27 @@ videoOut.start()
 
 classes = ['airplane', 'automobile', 'bird', 'cat', 'deer', 'dog', 'frog', 'horse', 'ship', 'truck']
 
+def annotate(frame, prediction):
+    class_name = classes[prediction]
+    cv2.putText(frame, class_name, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+    return frame
+
+pipeline = VideoPipeline(videoIn.readframe, preprocess_image, overlay.axi_dma_0, buffer_pool,
+                         annotate, videoOut.writeframe, queue_size=2, drop_policy='drop_oldest')
+
 try:
-    while True:
-        frame = videoIn.readframe()
-        if frame is not None:
-            prediction = predict(frame)
-            class_name = classes[prediction]
-            
-            cv2.putText(frame, class_name, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-            
-            videoOut.writeframe(frame)
+    pipeline.run()
 except KeyboardInterrupt:
     print("Stopping...")
 finally:
+    pipeline.close()
     videoIn.stop()
-    videoOut.stop()
\ No newline at end of file
+    videoOut.stop()
+    if batched_predictor is not None:
+        batched_predictor.close()
+    if async_predictor is not None:
+        async_predictor.close()
+    for stage, stats in pipeline.summary().items():
+        print(f"{stage}: {stats}")
+    print(f"Buffer pool: {buffer_pool.stats()}")
+    buffer_pool.close()
\ No newline at end of file
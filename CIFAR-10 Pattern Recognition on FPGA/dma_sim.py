@@ -0,0 +1,77 @@
+# Shared module: "CNN Image Classification on GPU and FPGA using ResNet-18 and ImageNet/src/benchmark.py"
+# imports this file instead of keeping a copy, so changes must work for both projects
+import asyncio
+import threading
+import time
+import numpy as np
+
+# Software model of an AXI DMA with the fabric behind it, exposing the same
+# sendchannel/recvchannel calls the scripts use on overlay.axi_dma_0.
+# The send channel completes after setup_latency, the receive channel
+# frame_latency per frame later, and the results are computed on its wait.
+# wait_async stands in for the interrupt-driven wait of a real channel.
+class SimulatedChannel:
+    def __init__(self, engine):
+        self.engine = engine
+        self.array = None
+        self.nbytes = 0
+        self.done_at = None
+
+    def transfer(self, array, start=0, nbytes=0):
+        if not self.idle:
+            raise RuntimeError("DMA channel is not idle")
+        self.wait()
+        self.array = array
+        self.nbytes = nbytes or array.nbytes
+        self.engine.transfer_started()
+
+    def wait(self):
+        self.engine.wait(self)
+
+    async def wait_async(self):
+        if self.done_at is not None:
+            remaining = self.done_at - time.perf_counter()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+        self.wait()
+
+    @property
+    def idle(self):
+        return self.array is None or (self.done_at is not None and time.perf_counter() >= self.done_at)
+
+class SimulatedDMA:
+    def __init__(self, compute_fn, setup_latency=0.0, frame_latency=0.0):
+        self.compute_fn = compute_fn
+        self.setup_latency = setup_latency
+        self.frame_latency = frame_latency
+        self.sendchannel = SimulatedChannel(self)
+        self.recvchannel = SimulatedChannel(self)
+        self.inputs = None
+        self.transfers = 0
+        self.lock = threading.Lock()
+
+    def transfer_started(self):
+        send, recv = self.sendchannel, self.recvchannel
+        with self.lock:
+            if send.array is None or recv.array is None or send.done_at is not None or recv.done_at is not None:
+                return
+            num_frames = send.nbytes // send.array[0].nbytes
+            self.inputs = np.array(send.array[:num_frames])
+            send.done_at = time.perf_counter() + self.setup_latency
+            recv.done_at = send.done_at + self.frame_latency * num_frames
+            self.transfers += 1
+
+    def wait(self, channel):
+        if channel.array is None:
+            return
+        if channel.done_at is None:
+            raise RuntimeError("Both DMA channels must be started before waiting")
+        remaining = channel.done_at - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+        with self.lock:
+            if channel is self.recvchannel:
+                channel.array[:len(self.inputs)] = self.compute_fn(self.inputs)
+                self.inputs = None
+            channel.array = None
+            channel.done_at = None
@@ -0,0 +1,228 @@
+import queue
+import threading
+import time
+import numpy as np
+
+DROP_POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.processed = 0
+        self.dropped = 0
+        self.busy_time = 0.0
+        self.occupancy_sum = 0
+        self.occupancy_samples = 0
+        self.occupancy_max = 0
+
+    def sample_occupancy(self, size):
+        self.occupancy_sum += size
+        self.occupancy_samples += 1
+        self.occupancy_max = max(self.occupancy_max, size)
+
+    def summary(self, elapsed):
+        return {
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'utilization': self.busy_time / elapsed if elapsed > 0 else 0.0,
+            'mean_queue_occupancy': self.occupancy_sum / self.occupancy_samples if self.occupancy_samples else 0.0,
+            'max_queue_occupancy': self.occupancy_max
+        }
+
+class StageQueue:
+    def __init__(self, maxsize, drop_policy='block', on_drop=None):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy {drop_policy!r}, expected one of {DROP_POLICIES}")
+        self.queue = queue.Queue(maxsize)
+        self.drop_policy = drop_policy
+        self.on_drop = on_drop
+        self.dropped = 0
+
+    def drop(self, item):
+        self.dropped += 1
+        if self.on_drop is not None:
+            self.on_drop(item)
+
+    def put(self, item, stop_event):
+        if self.drop_policy == 'drop_newest':
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self.drop(item)
+            return
+        if self.drop_policy == 'drop_oldest':
+            # Never waits: the oldest item is evicted until there is room
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        self.drop(self.queue.get_nowait())
+                    except queue.Empty:
+                        pass
+        while not stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.05)
+                return
+            except queue.Full:
+                pass
+        self.drop(item)
+
+    def get(self, stop_event):
+        while not stop_event.is_set():
+            try:
+                return self.queue.get(timeout=0.05)
+            except queue.Empty:
+                pass
+        return None
+
+    def qsize(self):
+        return self.queue.qsize()
+
+# capture -> preprocess -> DMA -> overlay, one thread per stage. Two DMA
+# buffer slots let frame N+1 be preprocessed while frame N is on the fabric.
+class VideoPipeline:
+    def __init__(self, read_frame, preprocess, dma, buffer_pool, annotate, write_frame,
+                 queue_size=2, drop_policy='drop_oldest', num_slots=2,
+                 input_shape=(3, 32, 32), num_classes=10):
+        self.read_frame = read_frame
+        self.preprocess = preprocess
+        self.dma = dma
+        self.buffer_pool = buffer_pool
+        self.annotate = annotate
+        self.write_frame = write_frame
+
+        self.free_slots = queue.Queue()
+        self.slots = []
+        for _ in range(num_slots):
+            slot = (buffer_pool.acquire((1,) + tuple(input_shape), np.float32),
+                    buffer_pool.acquire((1, num_classes), np.float32))
+            self.slots.append(slot)
+            self.free_slots.put(slot)
+
+        self.frames = StageQueue(queue_size, drop_policy)
+        self.ready = StageQueue(num_slots, 'block', on_drop=lambda item: self.free_slots.put(item[1]))
+        self.results = StageQueue(queue_size, drop_policy)
+        self.stats = {name: StageStats(name) for name in ('capture', 'preprocess', 'inference', 'output')}
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.errors = []
+        self.start_time = None
+        self.stop_time = None
+
+    def timed(self, stage, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self.stats[stage].busy_time += time.perf_counter() - start
+        return result
+
+    def capture_stage(self):
+        while not self.stop_event.is_set():
+            frame = self.timed('capture', self.read_frame)
+            if frame is None:
+                continue
+            self.stats['capture'].processed += 1
+            self.frames.put(frame, self.stop_event)
+
+    def preprocess_stage(self):
+        while not self.stop_event.is_set():
+            self.stats['preprocess'].sample_occupancy(self.frames.qsize())
+            frame = self.frames.get(self.stop_event)
+            if frame is None:
+                return
+            try:
+                slot = self.free_slots.get(timeout=1.0)
+            except queue.Empty:
+                self.frames.drop(frame)
+                continue
+            input_buffer, _ = slot
+            start = time.perf_counter()
+            input_buffer[0] = self.preprocess(frame)
+            self.stats['preprocess'].busy_time += time.perf_counter() - start
+            self.stats['preprocess'].processed += 1
+            self.ready.put((frame, slot), self.stop_event)
+
+    def inference_stage(self):
+        while not self.stop_event.is_set():
+            self.stats['inference'].sample_occupancy(self.ready.qsize())
+            item = self.ready.get(self.stop_event)
+            if item is None:
+                return
+            frame, slot = item
+            input_buffer, output_buffer = slot
+            start = time.perf_counter()
+            self.dma.sendchannel.transfer(input_buffer)
+            self.dma.recvchannel.transfer(output_buffer)
+            self.dma.sendchannel.wait()
+            self.dma.recvchannel.wait()
+            prediction = int(np.argmax(output_buffer[0]))
+            self.stats['inference'].busy_time += time.perf_counter() - start
+            self.stats['inference'].processed += 1
+            self.free_slots.put(slot)
+            self.results.put((frame, prediction), self.stop_event)
+
+    def output_stage(self):
+        while not self.stop_event.is_set():
+            self.stats['output'].sample_occupancy(self.results.qsize())
+            item = self.results.get(self.stop_event)
+            if item is None:
+                return
+            frame, prediction = item
+            start = time.perf_counter()
+            self.write_frame(self.annotate(frame, prediction))
+            self.stats['output'].busy_time += time.perf_counter() - start
+            self.stats['output'].processed += 1
+
+    def guarded(self, stage):
+        try:
+            stage()
+        except Exception as e:
+            self.errors.append(e)
+            self.stop_event.set()
+
+    def start(self):
+        self.stop_event.clear()
+        self.start_time = time.perf_counter()
+        self.stop_time = None
+        for stage in (self.capture_stage, self.preprocess_stage, self.inference_stage, self.output_stage):
+            thread = threading.Thread(target=self.guarded, args=(stage,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def run(self, duration=None):
+        self.start()
+        try:
+            while not self.stop_event.is_set():
+                if duration is not None and time.perf_counter() - self.start_time >= duration:
+                    break
+                time.sleep(0.05)
+        finally:
+            self.stop()
+        if self.errors:
+            raise self.errors[0]
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.stop_time is None and self.start_time is not None:
+            self.stop_time = time.perf_counter()
+
+    def summary(self):
+        end = self.stop_time if self.stop_time is not None else time.perf_counter()
+        elapsed = end - self.start_time if self.start_time is not None else 0.0
+        self.stats['preprocess'].dropped = self.frames.dropped
+        self.stats['inference'].dropped = self.ready.dropped
+        self.stats['output'].dropped = self.results.dropped
+        summary = {name: stats.summary(elapsed) for name, stats in self.stats.items()}
+        summary['fps'] = self.stats['output'].processed / elapsed if elapsed > 0 else 0.0
+        return summary
+
+    def close(self):
+        self.stop()
+        for input_buffer, output_buffer in self.slots:
+            self.buffer_pool.release(input_buffer)
+            self.buffer_pool.release(output_buffer)
+        self.slots = []
@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import warnings
+import numpy as np
+import torch
+from torch.ao.quantization import convert, get_default_qconfig, prepare
+from torchvision.models import resnet18
+from torchvision.models.quantization import resnet18 as quantizable_resnet18
+from preprocessing import FusedPreprocessor
+
+# dma_sim.py is shared with the CIFAR-10 project and only kept there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                             'CIFAR-10 Pattern Recognition on FPGA'))
+from dma_sim import SimulatedDMA
+
+STAGES = ('preprocess', 'transfer', 'compute', 'argmax')
+PERCENTILES = (50, 90, 99)
+
+def summarize_latencies(latencies):
+    latencies = np.asarray(latencies, dtype=np.float64)
+    summary = {f"p{p}": float(np.percentile(latencies, p)) for p in PERCENTILES}
+    summary['mean'] = float(latencies.mean())
+    return summary
+
+class TorchBackend:
+    def __init__(self, name, model):
+        self.name = name
+        self.model = model.eval()
+        self.input_buffer = np.empty((1, 3, 224, 224), dtype=np.float32)
+
+    def transfer(self):
+        self.inputs = torch.from_numpy(self.input_buffer)
+
+    def compute(self):
+        with torch.inference_mode():
+            self.logits = self.model(self.inputs)
+
+    def output(self):
+        return self.logits.numpy()[0]
+
+# Transfer covers the send channel, compute covers the wait for results
+class FPGABackend:
+    def __init__(self, name, dma, allocate_fn):
+        self.name = name
+        self.dma = dma
+        self.input_buffer = allocate_fn(shape=(1, 3, 224, 224), dtype=np.float32)
+        self.output_buffer = allocate_fn(shape=(1, 1000), dtype=np.float32)
+
+    def transfer(self):
+        self.dma.sendchannel.transfer(self.input_buffer)
+        self.dma.recvchannel.transfer(self.output_buffer)
+        self.dma.sendchannel.wait()
+
+    def compute(self):
+        self.dma.recvchannel.wait()
+
+    def output(self):
+        return self.output_buffer[0]
+
+def run_benchmark(backend, frames, preprocess, warmup=10, iterations=100):
+    stage_times = {stage: [] for stage in STAGES}
+    latencies = []
+
+    for i in range(warmup + iterations):
+        frame = frames[i % len(frames)]
+        t0 = time.perf_counter()
+        preprocess(frame, out=backend.input_buffer[0])
+        t1 = time.perf_counter()
+        backend.transfer()
+        t2 = time.perf_counter()
+        backend.compute()
+        t3 = time.perf_counter()
+        np.argmax(backend.output())
+        t4 = time.perf_counter()
+
+        if i >= warmup:
+            for stage, elapsed in zip(STAGES, (t1 - t0, t2 - t1, t3 - t2, t4 - t3)):
+                stage_times[stage].append(elapsed)
+            latencies.append(t4 - t0)
+
+    total_time = sum(latencies)
+    return {
+        'latency': summarize_latencies(latencies),
+        'throughput_fps': iterations / total_time,
+        'stages': {stage: summarize_latencies(times) for stage, times in stage_times.items()}
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Post-training static quantization of every conv and the fc layer, with
+# conv-bn-relu fused, calibrated on the given preprocessed inputs. This torch
+# release flags torch.ao eager quantization itself as deprecated, so its
+# warnings are silenced here.
+def quantize_static(model, calibration):
+    engine = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'qnnpack'
+    torch.backends.quantized.engine = engine
+    model_int8 = quantizable_resnet18()
+    model_int8.load_state_dict(model.state_dict())
+    model_int8.eval()
+    model_int8.fuse_model()
+    model_int8.qconfig = get_default_qconfig(engine)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        prepare(model_int8, inplace=True)
+        with torch.inference_mode():
+            model_int8(torch.from_numpy(calibration))
+        convert(model_int8, inplace=True)
+    return model_int8
+
+def build_backends(names, weights_path=None, bitstream=None, fpga_latency=0.005, calibration=None):
+    model = resnet18()
+    if weights_path is not None:
+        model.load_state_dict(torch.load(weights_path, map_location='cpu'))
+    model.eval()
+
+    backends = []
+    for name in names:
+        if name == 'cpu_fp32':
+            backends.append(TorchBackend(name, model))
+        elif name == 'cpu_int8':
+            if calibration is None:
+                calibration = np.random.default_rng(0).standard_normal((8, 3, 224, 224)).astype(np.float32)
+            backends.append(TorchBackend(name, quantize_static(model, calibration)))
+        elif name == 'fpga':
+            from pynq import Overlay, allocate
+            overlay = Overlay(bitstream)
+            backends.append(FPGABackend(name, overlay.axi_dma_0, allocate))
+        elif name == 'fpga_sim':
+            # The fabric's cost is fpga_latency alone: the logits are a fixed
+            # projection of the channel means, not a CPU forward pass
+            projection = np.random.default_rng(0).standard_normal((3, 1000)).astype(np.float32)
+            def compute_fn(inputs):
+                return inputs.mean(axis=(2, 3)) @ projection
+            dma = SimulatedDMA(compute_fn, frame_latency=fpga_latency)
+            backends.append(FPGABackend(name, dma, lambda shape, dtype: np.zeros(shape, dtype)))
+        else:
+            raise ValueError(f"Unknown backend {name!r}")
+    return backends
+
+def main():
+    parser = argparse.ArgumentParser(description="ResNet-18 inference latency/throughput benchmark")
+    parser.add_argument('--backends', default='cpu_fp32,cpu_int8,fpga_sim',
+                        help="comma separated list of cpu_fp32, cpu_int8, fpga, fpga_sim")
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--weights', default=None, help="resnet18_imagenet.pth state dict")
+    parser.add_argument('--bitstream', default='resnet18_imagenet.bit')
+    parser.add_argument('--fpga-latency', type=float, default=0.005,
+                        help="per-frame latency of the simulated FPGA in seconds")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    frames = [rng.integers(0, 256, size=(480, 640, 3), dtype=np.uint8) for _ in range(8)]
+    preprocess = FusedPreprocessor(size=224)
+    calibration = np.empty((len(frames), 3, 224, 224), dtype=np.float32)
+    for frame, out in zip(frames, calibration):
+        preprocess(frame, out=out)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': platform.platform(),
+        'torch_threads': torch.get_num_threads(),
+        'config': {'warmup': args.warmup, 'iterations': args.iterations, 'frame_shape': [480, 640, 3]},
+        'results': {}
+    }
+
+    for backend in build_backends(args.backends.split(','), args.weights, args.bitstream, args.fpga_latency,
+                                  calibration):
+        result = run_benchmark(backend, frames, preprocess, args.warmup, args.iterations)
+        report['results'][backend.name] = result
+        latency = result['latency']
+        print(f"{backend.name}: p50 {latency['p50'] * 1e3:.2f} ms, p90 {latency['p90'] * 1e3:.2f} ms, "
+              f"p99 {latency['p99'] * 1e3:.2f} ms, {result['throughput_fps']:.1f} FPS")
+        for stage in STAGES:
+            print(f"  {stage}: p50 {result['stages'][stage]['p50'] * 1e3:.3f} ms")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
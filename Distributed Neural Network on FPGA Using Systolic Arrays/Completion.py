@@ -0,0 +1,134 @@
+# Shared module: "Neural Genetic Scheduler on FPGA/neural_genetic_scheduler.py"
+# imports this file instead of keeping a copy, so changes must work for both projects
+import asyncio
+import threading
+import time
+import numpy as np
+
+# Ways of waiting for an HLS-style IP to raise ap_done (bit 1 of the control
+# register at 0x00). Every strategy records the CPU time the waiting thread
+# burned and the wall-clock completion latency, so modes can be compared per
+# deployment.
+class CompletionStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.cpu_time = 0.0
+        self.polls = 0
+
+    def record(self, latency, cpu_time, polls):
+        with self.lock:
+            self.latencies.append(latency)
+            self.cpu_time += cpu_time
+            self.polls += polls
+
+    def summary(self):
+        with self.lock:
+            latencies = np.asarray(self.latencies)
+            wall_time = float(latencies.sum()) if len(latencies) else 0.0
+            return {
+                'waits': len(latencies),
+                'mean_latency': float(latencies.mean()) if len(latencies) else 0.0,
+                'p99_latency': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+                'cpu_time': self.cpu_time,
+                'cpu_fraction': self.cpu_time / wall_time if wall_time > 0 else 0.0,
+                'polls': self.polls
+            }
+
+def is_done(ip, done_mask=0x2):
+    return (ip.read(0x00) & done_mask) != 0
+
+class Completion:
+    def __init__(self):
+        self.stats = CompletionStats()
+
+    def prepare(self, ip):
+        pass
+
+    def wait(self, ip):
+        start, cpu_start = time.perf_counter(), time.thread_time()
+        polls = self.wait_for_done(ip)
+        self.stats.record(time.perf_counter() - start, time.thread_time() - cpu_start, polls)
+
+    def summary(self):
+        return self.stats.summary()
+
+# Tight poll of the control register; lowest latency, one full core per wait
+class SpinWait(Completion):
+    def wait_for_done(self, ip):
+        polls = 1
+        while not is_done(ip):
+            polls += 1
+        return polls
+
+# Spin briefly for short jobs, then sleep with exponentially growing
+# intervals so long jobs give the core back to other threads
+class BackoffWait(Completion):
+    def __init__(self, spin_polls=64, initial_sleep=1e-6, max_sleep=1e-3):
+        super().__init__()
+        self.spin_polls = spin_polls
+        self.initial_sleep = initial_sleep
+        self.max_sleep = max_sleep
+
+    def wait_for_done(self, ip):
+        polls = 1
+        while not is_done(ip):
+            polls += 1
+            if polls > self.spin_polls:
+                break
+        else:
+            return polls
+        sleep = self.initial_sleep
+        while not is_done(ip):
+            time.sleep(sleep)
+            sleep = min(sleep * 2, self.max_sleep)
+            polls += 1
+        return polls
+
+# Block on the IP's interrupt line (a pynq Interrupt, whose wait() is a
+# coroutine, or anything with a blocking wait()). Interrupts are enabled in
+# the HLS global/IP interrupt enable registers and acknowledged in the ISR.
+class InterruptWait(Completion):
+    def __init__(self, interrupt):
+        super().__init__()
+        self.interrupt = interrupt
+        self.loop = None
+        self.loop_lock = threading.Lock()
+
+    def prepare(self, ip):
+        ip.write(0x04, 0x1)
+        ip.write(0x08, 0x1)
+
+    # Coroutine waits run on one background event loop shared by all callers
+    def event_loop(self):
+        with self.loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, daemon=True).start()
+            return self.loop
+
+    def block(self):
+        result = self.interrupt.wait()
+        if asyncio.iscoroutine(result):
+            asyncio.run_coroutine_threadsafe(result, self.event_loop()).result()
+
+    def wait_for_done(self, ip):
+        polls = 1
+        while not is_done(ip):
+            self.block()
+            polls += 1
+        ip.write(0x0C, 0x1)
+        return polls
+
+COMPLETION_MODES = ('spin', 'backoff', 'interrupt')
+
+def make_completion(mode='spin', interrupt=None, **kwargs):
+    if mode == 'spin':
+        return SpinWait()
+    if mode == 'backoff':
+        return BackoffWait(**kwargs)
+    if mode == 'interrupt':
+        if interrupt is None:
+            raise ValueError("Interrupt completion needs an IP with an interrupt line")
+        return InterruptWait(interrupt)
+    raise ValueError(f"Unknown completion mode {mode!r}, expected one of {COMPLETION_MODES}")
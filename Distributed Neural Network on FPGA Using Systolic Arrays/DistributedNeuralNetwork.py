@@ -1,46 +1,194 @@
-import pynq
-from pynq import Overlay
-from pynq import allocate
 import numpy as np
 import time
+import hashlib
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from Quantization import calibrate, float_forward, reference_check
+from Completion import make_completion
+
+try:
+    from pynq import Overlay
+    from pynq import allocate
+except ImportError:
+    Overlay = None
+    allocate = None
+
+def software_allocate(shape, dtype):
+    return np.zeros(shape, dtype=dtype)
+
+# Keeps layer weight buffers allocated on a device across forward passes.
+# Entries are keyed by (layer, column block) and replaced when the weight
+# version changes; the least recently used entries are freed once the cache
+# holds more than capacity_bytes.
+class WeightCache:
+    def __init__(self, capacity_bytes):
+        self.capacity_bytes = capacity_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def free(self, buffer):
+        self.bytes -= buffer.nbytes
+        if hasattr(buffer, 'freebuffer'):
+            buffer.freebuffer()
+
+    def get(self, key, version, load):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            if entry is not None:
+                del self.entries[key]
+                self.free(entry[1])
+
+            buffer = load()
+            self.entries[key] = (version, buffer)
+            self.bytes += buffer.nbytes
+            while self.bytes > self.capacity_bytes and len(self.entries) > 1:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.free(evicted)
+                self.evictions += 1
+            return buffer
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'resident_bytes': self.bytes
+        }
+
+def weight_version(matrix):
+    return hashlib.blake2b(np.ascontiguousarray(matrix).view(np.uint8), digest_size=16).hexdigest()
 
 class DistributedNeuralNetwork:
-    def __init__(self, num_fpgas, bitstream_path):
+    def __init__(self, num_fpgas, bitstream_path, systolic_arrays=None, allocate_fn=None, whole_shard=False,
+                 partitioning='rows', load_balance=False, weight_cache_bytes=64 * 1024 * 1024,
+                 completion='spin', **completion_options):
         self.num_fpgas = num_fpgas
-        self.fpgas = [Overlay(bitstream_path) for _ in range(num_fpgas)]
-        self.systolic_arrays = [fpga.systolic_array_0 for fpga in self.fpgas]
+        if systolic_arrays is None:
+            self.fpgas = [Overlay(bitstream_path) for _ in range(num_fpgas)]
+            self.systolic_arrays = [fpga.systolic_array_0 for fpga in self.fpgas]
+        else:
+            self.fpgas = [None] * num_fpgas
+            self.systolic_arrays = list(systolic_arrays)
+        self.allocate = allocate_fn or allocate or software_allocate
         self.data_width = 16
         self.array_size = 4
+        self.whole_shard = whole_shard
+        self.partitioning = partitioning
+        self.load_balance = load_balance
+        self.device_throughput = np.ones(num_fpgas)
+        self.weight_caches = [WeightCache(weight_cache_bytes) for _ in range(num_fpgas)]
+        self.completions = [make_completion(completion, getattr(systolic_array, 'interrupt', None), **completion_options)
+                            for systolic_array in self.systolic_arrays]
+        for completion_wait, systolic_array in zip(self.completions, self.systolic_arrays):
+            completion_wait.prepare(systolic_array)
+        self.executor = ThreadPoolExecutor(max_workers=num_fpgas)
+        self.device_timings = []
+        self.transfer_bytes = 0
+
+    # Split total rows into num_parts chunks proportional to weights, in whole
+    # array_size blocks where possible; leftover blocks go to the largest
+    # fractional shares so no rows are dropped
+    def partition_sizes(self, total, num_parts, weights=None):
+        if total == 0:
+            return np.zeros(num_parts, dtype=int)
+        weights = np.ones(num_parts) if weights is None else np.asarray(weights, dtype=np.float64)
+        blocks = -(-total // self.array_size)
+        share = weights / weights.sum() * blocks
+        sizes = np.floor(share).astype(int)
+        leftover = blocks - sizes.sum()
+        sizes[np.argsort(sizes - share, kind='stable')[:leftover]] += 1
+        sizes *= self.array_size
+        sizes[np.nonzero(sizes)[0][-1]] -= sizes.sum() - total
+        return sizes
+
+    def partition_bounds(self, total, num_parts, weights=None):
+        sizes = self.partition_sizes(total, num_parts, weights)
+        bounds = np.concatenate([[0], np.cumsum(sizes)])
+        return [(bounds[i], bounds[i + 1]) for i in range(num_parts)]
+
+    def distribute_matrix(self, matrix, weights=None):
+        if weights is None and self.load_balance:
+            weights = self.device_throughput
+        return [matrix[start:end] for start, end in self.partition_bounds(matrix.shape[0], self.num_fpgas, weights)]
+
+    # Pick the rows x cols device grid that moves the fewest bytes host->device
+    def grid_shape(self, A, B):
+        best = None
+        for grid_rows in range(1, self.num_fpgas + 1):
+            if self.num_fpgas % grid_rows:
+                continue
+            grid_cols = self.num_fpgas // grid_rows
+            cost = A.shape[0] * A.shape[1] * grid_cols + B.shape[0] * B.shape[1] * grid_rows
+            if best is None or cost < best[0]:
+                best = (cost, grid_rows, grid_cols)
+        return best[1], best[2]
+
+    def plan(self, A, B, partitioning):
+        rows, cols = A.shape[0], B.shape[1]
+        if partitioning == 'rows':
+            weights = self.device_throughput if self.load_balance else None
+            return [((start, end), (0, cols)) for start, end in self.partition_bounds(rows, self.num_fpgas, weights)]
+        if partitioning == '2d':
+            grid_rows, grid_cols = self.grid_shape(A, B)
+            row_bounds = self.partition_bounds(rows, grid_rows)
+            col_bounds = self.partition_bounds(cols, grid_cols)
+            return [(row_block, col_block) for row_block in row_bounds for col_block in col_bounds]
+        raise ValueError(f"Unknown partitioning {partitioning!r}, expected 'rows' or '2d'")
+
+    def padded(self, size):
+        return -(-size // self.array_size) * self.array_size
 
-    def distribute_matrix(self, matrix):
-        rows, cols = matrix.shape
-        fpga_rows = rows // self.num_fpgas
-        distributed = []
-        for i in range(self.num_fpgas):
-            start = i * fpga_rows
-            end = (i + 1) * fpga_rows
-            distributed.append(matrix[start:end])
-        return distributed
+    def load_matrix(self, B):
+        cols = B.shape[1]
+        B_buffer = self.allocate(shape=(B.shape[0], self.padded(cols)), dtype=np.int16)
+        B_buffer[:, cols:] = 0
+        np.copyto(B_buffer[:, :cols], B)
+        return B_buffer
 
-    def matrix_multiply(self, A, B):
-        distributed_A = self.distribute_matrix(A)
-        result = []
+    def multiply_shard(self, device, A_part, B, cache_key=None):
+        systolic_array = self.systolic_arrays[device]
+        rows, cols = A_part.shape[0], B.shape[1]
 
-        for i, A_part in enumerate(distributed_A):
-            fpga = self.fpgas[i]
-            systolic_array = self.systolic_arrays[i]
+        # Tiles are always array_size x array_size, so edge tiles are zero padded
+        A_buffer = self.allocate(shape=(self.padded(rows), A_part.shape[1]), dtype=np.int16)
+        C_buffer = self.allocate(shape=(self.padded(rows), self.padded(cols)), dtype=np.int32)
 
-            A_buffer = allocate(shape=A_part.shape, dtype=np.int16)
-            B_buffer = allocate(shape=B.shape, dtype=np.int16)
-            C_buffer = allocate(shape=(A_part.shape[0], B.shape[1]), dtype=np.int32)
+        A_buffer[rows:] = 0
+        np.copyto(A_buffer[:rows], A_part)
 
-            np.copyto(A_buffer, A_part)
-            np.copyto(B_buffer, B)
+        # loaded is True when B is sent to the device: uncached, or a cache miss
+        loaded = cache_key is None
+        def load():
+            nonlocal loaded
+            loaded = True
+            return self.load_matrix(B)
 
-            start_time = time.time()
+        if cache_key is None:
+            B_buffer = load()
+        else:
+            key, version = cache_key
+            B_buffer = self.weight_caches[device].get(key, version, load)
 
-            for i in range(0, A_part.shape[0], self.array_size):
-                for j in range(0, B.shape[1], self.array_size):
+        start_time = time.time()
+
+        if self.whole_shard and hasattr(systolic_array, 'multiply'):
+            C_buffer[:] = systolic_array.multiply(A_buffer, B_buffer)
+        else:
+            for i in range(0, A_buffer.shape[0], self.array_size):
+                for j in range(0, B_buffer.shape[1], self.array_size):
                     weights = A_buffer[i:i+self.array_size, :].flatten()
                     activations = B_buffer[:, j:j+self.array_size].T.flatten()
 
@@ -48,45 +196,181 @@ class DistributedNeuralNetwork:
                     systolic_array.write(0x20, activations.tobytes())
                     systolic_array.write(0x00, 1)
 
-                    while (systolic_array.read(0x00) & 0x2) == 0:
-                        pass
+                    self.completions[device].wait(systolic_array)
 
-                    partial_result = np.frombuffer(systolic_array.read(0x30, self.array_size * 4), dtype=np.int32)
+                    partial_result = np.frombuffer(systolic_array.read(0x30, self.array_size * self.array_size * 4), dtype=np.int32)
                     C_buffer[i:i+self.array_size, j:j+self.array_size] = partial_result.reshape((self.array_size, self.array_size))
 
-            end_time = time.time()
-            print(f"FPGA {i} computation time: {end_time - start_time:.4f} seconds")
+        end_time = time.time()
+        return np.array(C_buffer[:rows, :cols]), end_time - start_time, loaded
+
+    def matrix_multiply(self, A, B, partitioning=None, layer=None, version=None):
+        plan = self.plan(A, B, partitioning or self.partitioning)
+        C = np.zeros((A.shape[0], B.shape[1]), dtype=np.int32)
+
+        # One worker per overlay, so every device's shard runs at the same time
+        start_time = time.time()
+        futures = {}
+        for device, ((r0, r1), (c0, c1)) in enumerate(plan):
+            if r1 > r0 and c1 > c0:
+                cache_key = None if layer is None else ((layer, c0, c1), version)
+                futures[device] = self.executor.submit(self.multiply_shard, device, A[r0:r1], B[:, c0:c1], cache_key)
+        shards = {device: future.result() for device, future in futures.items()}
+        wall_time = time.time() - start_time
+
+        self.transfer_bytes = 0
+        self.device_timings = [0.0] * self.num_fpgas
+        for device, (C_part, elapsed, loaded) in shards.items():
+            (r0, r1), (c0, c1) = plan[device]
+            C[r0:r1, c0:c1] = C_part
+            self.device_timings[device] = elapsed
+            self.transfer_bytes += (r1 - r0) * A.shape[1] * 2
+            if loaded:
+                self.transfer_bytes += B.shape[0] * (c1 - c0) * 2
+            if elapsed > 0:
+                throughput = (r1 - r0) * A.shape[1] * (c1 - c0) / elapsed
+                self.device_throughput[device] = 0.5 * self.device_throughput[device] + 0.5 * throughput
 
-            result.append(np.array(C_buffer))
+        timings = ", ".join(f"FPGA {i}: {elapsed:.4f}s" for i, elapsed in enumerate(self.device_timings))
+        print(f"Computation times ({timings}), wall: {wall_time:.4f}s, host->device: {self.transfer_bytes} bytes")
 
-        return np.vstack(result)
+        return C
 
-    def forward_pass(self, input_data, weights):
+    # weight_versions lets the caller bump a per-layer version when weights
+    # change; without it each layer's weights are hashed to detect changes
+    def forward_pass(self, input_data, weights, weight_versions=None):
         result = input_data
-        for layer_weights in weights:
-            result = self.matrix_multiply(result, layer_weights)
+        for layer, layer_weights in enumerate(weights):
+            version = weight_versions[layer] if weight_versions is not None else weight_version(layer_weights)
+            result = self.matrix_multiply(result, layer_weights, layer=layer, version=version)
             result = np.maximum(result, 0)  # ReLU activation
         return result
 
-num_fpgas = 4
-bitstream_path = "systolic_array.bit"
-dnn = DistributedNeuralNetwork(num_fpgas, bitstream_path)
+    # Float model at int16 throughput: quantize the input once, run each GEMM
+    # on the systolic arrays and requantize the int32 accumulators on the host
+    def quantized_forward(self, input_data, layers):
+        x = layers[0].quantize_input(input_data)
+        for index, layer in enumerate(layers):
+            acc = self.matrix_multiply(x, layer.weight, layer=index, version=layer.version)
+            if index + 1 < len(layers):
+                x = layer.requantize(acc, layers[index + 1])
+            else:
+                return layer.dequantize_output(acc)
+
+    # Contiguous layer groups, one per device, balanced by multiply-accumulates
+    def assign_stages(self, weights):
+        costs = [w.shape[0] * w.shape[1] for w in weights]
+        num_stages = min(self.num_fpgas, len(weights))
+        stages = []
+        start = 0
+        for stage in range(num_stages):
+            remaining_stages = num_stages - stage
+            target = sum(costs[start:]) / remaining_stages
+            end = start + 1
+            while len(weights) - end >= remaining_stages and sum(costs[start:end + 1]) <= target:
+                end += 1
+            if remaining_stages == 1:
+                end = len(weights)
+            stages.append(list(range(start, end)))
+            start = end
+        return stages
+
+    # Pipeline-parallel forward pass: stage k owns a group of layers on device
+    # k and works on micro-batch i while stage k+1 handles micro-batch i-1
+    def pipeline_forward(self, input_data, weights, micro_batch_size=8, stages=None, weight_versions=None):
+        stages = stages or self.assign_stages(weights)
+        if len(stages) > self.num_fpgas:
+            raise ValueError(f"{len(stages)} pipeline stages but only {self.num_fpgas} FPGAs")
+        versions = [weight_versions[layer] if weight_versions is not None else weight_version(w)
+                    for layer, w in enumerate(weights)]
+        micro_batches = [input_data[i:i + micro_batch_size] for i in range(0, len(input_data), micro_batch_size)]
+        queues = [queue.Queue() for _ in range(len(stages) + 1)]
+        busy = [0.0] * len(stages)
+        errors = []
+
+        def run_stage(device, layers):
+            while True:
+                item = queues[device].get()
+                if item is None:
+                    queues[device + 1].put(None)
+                    return
+                index, x = item
+                start = time.time()
+                try:
+                    for layer in layers:
+                        C_part, _, _ = self.multiply_shard(device, x, weights[layer],
+                                                        ((layer, 0, weights[layer].shape[1]), versions[layer]))
+                        x = np.maximum(C_part, 0)  # ReLU activation
+                except Exception as e:
+                    errors.append(e)
+                    x = None
+                busy[device] += time.time() - start
+                queues[device + 1].put((index, x))
+
+        start_time = time.time()
+        threads = [threading.Thread(target=run_stage, args=(device, layers), daemon=True)
+                   for device, layers in enumerate(stages)]
+        for thread in threads:
+            thread.start()
+        for index, micro_batch in enumerate(micro_batches):
+            queues[0].put((index, micro_batch))
+        queues[0].put(None)
+
+        outputs = [None] * len(micro_batches)
+        while True:
+            item = queues[-1].get()
+            if item is None:
+                break
+            index, x = item
+            outputs[index] = x
+        for thread in threads:
+            thread.join()
+        wall_time = time.time() - start_time
+        if errors:
+            raise errors[0]
+
+        utilization = [b / wall_time if wall_time > 0 else 0.0 for b in busy]
+        num_stages, num_micro_batches = len(stages), len(micro_batches)
+        self.pipeline_report = {
+            'stages': stages,
+            'micro_batch_size': micro_batch_size,
+            'micro_batches': num_micro_batches,
+            'wall_time': wall_time,
+            'stage_busy_time': busy,
+            'stage_utilization': utilization,
+            'bubble': 1.0 - sum(utilization) / num_stages,
+            'ideal_bubble': (num_stages - 1) / (num_micro_batches + num_stages - 1)
+        }
+        return np.vstack(outputs)
+
+    def completion_stats(self):
+        return [completion_wait.summary() for completion_wait in self.completions]
+
+    def weight_cache_stats(self):
+        return [cache.stats() for cache in self.weight_caches]
+
+if __name__ == "__main__":
+    num_fpgas = 4
+    bitstream_path = "systolic_array.bit"
+    dnn = DistributedNeuralNetwork(num_fpgas, bitstream_path)
 
-input_size = 1024
-hidden_size = 512
-output_size = 10
-batch_size = 32
+    input_size = 1024
+    hidden_size = 512
+    output_size = 10
+    batch_size = 32
 
-input_data = np.random.rand(batch_size, input_size).astype(np.float16)
-weights = [
-    np.random.rand(input_size, hidden_size).astype(np.float16),
-    np.random.rand(hidden_size, hidden_size).astype(np.float16),
-    np.random.rand(hidden_size, output_size).astype(np.float16)
-]
+    input_data = np.random.rand(batch_size, input_size).astype(np.float16)
+    weights = [
+        (np.random.rand(input_size, hidden_size) - 0.5).astype(np.float16),
+        (np.random.rand(hidden_size, hidden_size) - 0.5).astype(np.float16),
+        (np.random.rand(hidden_size, output_size) - 0.5).astype(np.float16)
+    ]
+    layers = calibrate(weights, input_data)
 
-start_time = time.time()
-output = dnn.forward_pass(input_data, weights)
-end_time = time.time()
+    start_time = time.time()
+    output = dnn.quantized_forward(input_data, layers)
+    end_time = time.time()
 
-print(f"Total computation time: {end_time - start_time:.4f} seconds")
-print(f"Output shape: {output.shape}")
\ No newline at end of file
+    print(f"Total computation time: {end_time - start_time:.4f} seconds")
+    print(f"Output shape: {output.shape}")
+    print(f"Accuracy vs float reference: {reference_check(output, float_forward(input_data, weights))}")
\ No newline at end of file
@@ -0,0 +1,86 @@
+import itertools
+import numpy as np
+
+INT32_MAX = 2**31 - 1
+INT16_MAX = 2**15 - 1
+
+layer_versions = itertools.count()
+
+# Largest symmetric int16 level for operands of a K-deep dot product such that
+# the systolic array's int32 accumulator cannot overflow
+def operand_limit(K):
+    return int(min(INT16_MAX, np.floor(np.sqrt(INT32_MAX / K))))
+
+def quantize(x, scale, zero_point, qmax=INT16_MAX):
+    q = np.rint(np.asarray(x, dtype=np.float64) / scale) + zero_point
+    return np.clip(q, -qmax, qmax).astype(np.int16)
+
+def dequantize(q, scale, zero_point):
+    return (np.asarray(q, dtype=np.float64) - zero_point) * scale
+
+# Asymmetric per-tensor parameters for activations; the range always
+# contains zero so that ReLU's zero is exactly representable
+def activation_qparams(x_min, x_max, qmax):
+    x_min, x_max = min(float(x_min), 0.0), max(float(x_max), 0.0)
+    scale = (x_max - x_min) / (2 * qmax) if x_max > x_min else 1.0
+    zero_point = int(np.clip(np.rint(-qmax - x_min / scale), -qmax, qmax))
+    return scale, zero_point
+
+# Symmetric weight scales, one per output column (per_channel) or per layer
+def weight_scales(weights, qmax, per_channel=True):
+    max_abs = np.abs(weights).max(axis=0) if per_channel else np.full(weights.shape[1], np.abs(weights).max())
+    return np.where(max_abs > 0, max_abs / qmax, 1.0)
+
+class QuantizedLayer:
+    def __init__(self, weights, input_range, per_channel=True):
+        self.qmax = operand_limit(weights.shape[0])
+        self.weight_scale = weight_scales(weights, self.qmax, per_channel)
+        self.weight = quantize(weights, self.weight_scale, 0, self.qmax)
+        self.col_sums = self.weight.astype(np.int64).sum(axis=0)
+        self.input_scale, self.input_zero_point = activation_qparams(*input_range, self.qmax)
+        self.version = next(layer_versions)
+
+    def quantize_input(self, x):
+        return quantize(x, self.input_scale, self.input_zero_point, self.qmax)
+
+    # Real-valued output = input_scale * weight_scale * (acc - zp_in * colsum(W))
+    def corrected(self, acc):
+        return acc.astype(np.int64) - self.input_zero_point * self.col_sums
+
+    def dequantize_output(self, acc, relu=True):
+        out = self.corrected(acc) * (self.input_scale * self.weight_scale)
+        return np.maximum(out, 0) if relu else out
+
+    # int32 accumulators straight to the next layer's int16 input with ReLU
+    # fused as a clamp at the next layer's zero point
+    def requantize(self, acc, next_layer, relu=True):
+        multiplier = self.input_scale * self.weight_scale / next_layer.input_scale
+        q = np.rint(self.corrected(acc) * multiplier) + next_layer.input_zero_point
+        if relu:
+            q = np.maximum(q, next_layer.input_zero_point)
+        return np.clip(q, -next_layer.qmax, next_layer.qmax).astype(np.int16)
+
+def float_forward(input_data, weights):
+    result = np.asarray(input_data, dtype=np.float64)
+    for layer_weights in weights:
+        result = np.maximum(result @ layer_weights.astype(np.float64), 0)
+    return result
+
+def calibrate(weights, calibration_data, per_channel=True):
+    layers = []
+    activations = np.asarray(calibration_data, dtype=np.float64)
+    for layer_weights in weights:
+        layers.append(QuantizedLayer(np.asarray(layer_weights, dtype=np.float64),
+                                     (activations.min(), activations.max()), per_channel))
+        activations = np.maximum(activations @ layer_weights.astype(np.float64), 0)
+    return layers
+
+def reference_check(quantized_output, reference_output):
+    error = np.abs(quantized_output - reference_output)
+    scale = np.abs(reference_output).max()
+    return {
+        'max_abs_error': float(error.max()),
+        'relative_error': float(np.linalg.norm(error) / max(np.linalg.norm(reference_output), 1e-12)),
+        'max_error_vs_range': float(error.max() / scale) if scale > 0 else 0.0,
+        'argmax_agreement': float(np.mean(quantized_output.argmax(axis=1) == reference_output.argmax(axis=1)))
+    }
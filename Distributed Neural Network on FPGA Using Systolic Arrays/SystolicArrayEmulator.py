@@ -0,0 +1,106 @@
+import asyncio
+import time
+import numpy as np
+
+# Software stand-in for the systolic_array_0 register interface used by
+# DistributedNeuralNetwork: 0x10 weights, 0x20 activations, 0x00 control
+# (bit 0 start, bit 1 done, cleared on read, bit 2 idle) and 0x30 results.
+# A tile completes tile_latency seconds after it is started and can raise
+# an interrupt, so every completion mode can be exercised off-board.
+#
+# Arithmetic follows ProcessingElement.vhdl: signed DATA_WIDTH-bit operands,
+# a 2*DATA_WIDTH-bit product and a 2*DATA_WIDTH-bit accumulator that wraps
+# on overflow.
+def systolic_gemm(weights, activations):
+    weights = np.asarray(weights, dtype=np.int16).astype(np.int64)
+    activations = np.asarray(activations, dtype=np.int16).astype(np.int64)
+    return (weights @ activations).astype(np.int32)
+
+class EmulatedInterrupt:
+    def __init__(self, ip):
+        self.ip = ip
+
+    async def wait(self):
+        while True:
+            remaining = self.ip.done_at - time.perf_counter()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(remaining)
+
+class EmulatedSystolicArray:
+    def __init__(self, array_size=4, tile_latency=0.0):
+        self.array_size = array_size
+        self.tile_latency = tile_latency
+        self.registers = {0x00: 0x4}
+        self.results = b""
+        self.done_at = 0.0
+        self.tiles = 0
+        self.shards = 0
+        self.interrupt = EmulatedInterrupt(self)
+
+    def write(self, offset, value):
+        if offset == 0x00:
+            if value & 0x1:
+                self.start()
+        else:
+            self.registers[offset] = value
+
+    def read(self, offset, length=4):
+        if offset == 0x30:
+            return self.results[:length]
+        if offset == 0x00:
+            status = self.registers[0x00]
+            if status & 0x1 and time.perf_counter() >= self.done_at:
+                self.registers[0x00] = 0x4
+                return 0x2 | 0x4
+            return status
+        return self.registers.get(offset, 0)
+
+    def start(self):
+        self.registers[0x00] = 0x1
+        weights = np.frombuffer(self.registers[0x10], dtype=np.int16).reshape(self.array_size, -1)
+        activations = np.frombuffer(self.registers[0x20], dtype=np.int16).reshape(self.array_size, -1)
+        if weights.shape != activations.shape:
+            raise ValueError(f"Weight tile {weights.shape} and activation tile {activations.shape} do not match")
+        self.results = systolic_gemm(weights, activations.T).tobytes()
+        self.tiles += 1
+        self.done_at = time.perf_counter() + self.tile_latency
+
+    # Whole-shard fast path: the full GEMM in one call instead of one
+    # register round trip per array_size x array_size tile
+    def multiply(self, A, B):
+        tiles = -(-A.shape[0] // self.array_size) * -(-B.shape[1] // self.array_size)
+        if self.tile_latency:
+            time.sleep(self.tile_latency * tiles)
+        self.tiles += tiles
+        self.shards += 1
+        return systolic_gemm(A, B)
+
+def benchmark_tile_loop(rows=256, inner=512, cols=256, num_fpgas=1, repeats=3):
+    from DistributedNeuralNetwork import DistributedNeuralNetwork
+
+    rng = np.random.default_rng(0)
+    A = rng.integers(-128, 128, size=(rows, inner)).astype(np.int16)
+    B = rng.integers(-128, 128, size=(inner, cols)).astype(np.int16)
+    reference = systolic_gemm(A, B)
+
+    results = {}
+    for whole_shard in (False, True):
+        dnn = DistributedNeuralNetwork(num_fpgas, None, whole_shard=whole_shard,
+                                       systolic_arrays=[EmulatedSystolicArray() for _ in range(num_fpgas)])
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            C = dnn.matrix_multiply(A, B)
+            best = min(best, time.perf_counter() - start)
+        if not np.array_equal(C, reference):
+            raise AssertionError("Emulated GEMM does not match the reference")
+        results['whole_shard' if whole_shard else 'per_tile'] = best
+    results['tile_loop_overhead'] = results['per_tile'] - results['whole_shard']
+    return results
+
+if __name__ == "__main__":
+    results = benchmark_tile_loop()
+    print(f"Per-tile register protocol: {results['per_tile']:.4f} seconds")
+    print(f"Whole-shard fast path: {results['whole_shard']:.4f} seconds")
+    print(f"Python tile loop overhead: {results['tile_loop_overhead']:.4f} seconds")
@@ -0,0 +1,98 @@
+import asyncio
+import time
+import numpy as np
+from genetic_engine import roulette_select, crossover, mutate
+from neural_genetic_scheduler import software_allocate
+
+# Software stand-ins for neural_layer_0 and genetic_algorithm_0. Buffers are
+# allocated from an EmulatedMemory so the cores can resolve the physical
+# addresses written to their registers. Control register 0x00: bit 0 start,
+# bit 1 done (cleared on read), bit 2 idle. A job completes latency seconds
+# after it is started, which lets scheduling strategies be compared off-board.
+class EmulatedMemory:
+    def __init__(self):
+        self.buffers = {}
+
+    def allocate(self, shape, dtype):
+        buffer = software_allocate(shape, dtype)
+        self.buffers[buffer.physical_address] = buffer
+        return buffer
+
+    def __getitem__(self, address):
+        return self.buffers[address]
+
+class EmulatedInterrupt:
+    def __init__(self, core):
+        self.core = core
+
+    async def wait(self):
+        while True:
+            remaining = self.core.done_at - time.perf_counter()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(remaining)
+
+class EmulatedCore:
+    def __init__(self, memory, latency=0.0):
+        self.memory = memory
+        self.latency = latency
+        self.registers = {0x00: 0x4}
+        self.done_at = 0.0
+        self.jobs = 0
+        self.busy_time = 0.0
+        self.interrupt = EmulatedInterrupt(self)
+
+    def write(self, offset, value):
+        if offset == 0x00:
+            if value & 0x1:
+                self.start()
+        else:
+            self.registers[offset] = value
+
+    def read(self, offset):
+        if offset == 0x00:
+            status = self.registers[0x00]
+            if status & 0x1 and time.perf_counter() >= self.done_at:
+                self.registers[0x00] = 0x4
+                return 0x2 | 0x4
+            return status
+        return self.registers.get(offset, 0)
+
+    def start(self):
+        if self.registers[0x00] & 0x1:
+            raise RuntimeError(f"{type(self).__name__} started while busy")
+        self.registers[0x00] = 0x1
+        start = time.perf_counter()
+        self.run()
+        self.done_at = max(time.perf_counter(), start + self.latency)
+        self.busy_time += self.done_at - start
+        self.jobs += 1
+
+# 0x10 weights, 0x18 biases, 0x20 inputs, 0x28 outputs (one ReLU output per neuron)
+class EmulatedNeuralLayer(EmulatedCore):
+    def run(self):
+        weights, biases = self.memory[self.registers[0x10]], self.memory[self.registers[0x18]]
+        inputs, outputs = self.memory[self.registers[0x20]], self.memory[self.registers[0x28]]
+        np.copyto(outputs, np.maximum(inputs @ weights.T + biases, 0))
+
+# 0x10 fitness, 0x18 population: the parents are read from the population
+# buffer and overwritten with the children
+class EmulatedGeneticAlgorithm(EmulatedCore):
+    def __init__(self, memory, latency=0.0, mutation_rate=5, seed=None):
+        super().__init__(memory, latency)
+        self.mutation_rate = mutation_rate
+        self.rng = np.random.default_rng(seed)
+
+    def run(self):
+        fitness, population = self.memory[self.registers[0x10]], self.memory[self.registers[0x18]]
+        size = len(population)
+        parents = roulette_select(fitness, 2 * size, self.rng)
+        children = crossover(population[parents[:size]], population[parents[size:]], self.rng)
+        np.copyto(population, mutate(children, self.mutation_rate, self.rng))
+
+# Returns (cores, allocate_fn) for NeuralGeneticScheduler(None, cores=..., allocate_fn=...)
+def emulated_cores(neural_layer_latency=0.0, genetic_algorithm_latency=0.0, mutation_rate=5, seed=None):
+    memory = EmulatedMemory()
+    cores = (EmulatedNeuralLayer(memory, neural_layer_latency),
+             EmulatedGeneticAlgorithm(memory, genetic_algorithm_latency, mutation_rate, seed))
+    return cores, memory.allocate
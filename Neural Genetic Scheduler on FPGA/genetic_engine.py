@@ -0,0 +1,254 @@
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+
+# Pure-NumPy counterpart of the neural_layer_0 / genetic_algorithm_0 cores.
+# A whole population is scored with one matmul and bred with array
+# operations, so scheduling instances can be solved off-board and many of
+# them spread over a process pool.
+
+# A chromosome of chromosome_length bits feeds num_inputs neural-layer inputs,
+# each an unsigned integer of chromosome_length // num_inputs bits (bit 0 is
+# the least significant, as in the VHDL std_logic_vectors)
+def encode_population(population, num_inputs):
+    population = np.asarray(population)
+    size, chromosome_length = population.shape
+    if chromosome_length % num_inputs:
+        raise ValueError(f"Chromosome length {chromosome_length} is not a multiple of {num_inputs} inputs")
+    bits = chromosome_length // num_inputs
+    place_values = (1 << np.arange(bits)).astype(np.float32)
+    return population.reshape(size, num_inputs, bits).astype(np.float32) @ place_values
+
+# Neuron.vhdl: ReLU(inputs . weights + bias) per neuron; the fitness of a
+# chromosome is the sum of the layer outputs
+def neural_fitness(inputs, weights, biases):
+    return np.maximum(inputs @ weights.T + biases, 0).sum(axis=1)
+
+# Roulette-wheel selection as in genetic_algorithm.vhdl, with a real PRNG in
+# place of the fixed total_fitness - 1 draw. An all-zero population is
+# sampled uniformly.
+def roulette_select(fitness, count, rng):
+    cumulative = np.cumsum(fitness, dtype=np.int64)
+    total = cumulative[-1]
+    if total <= 0:
+        return rng.integers(0, len(fitness), size=count)
+    return np.searchsorted(cumulative, rng.integers(0, total, size=count), side='right')
+
+# Single-point crossover: bits below the crossover point come from parent2,
+# the rest from parent1
+def crossover(parent1, parent2, rng):
+    chromosome_length = parent1.shape[1]
+    points = rng.integers(1, chromosome_length, size=(len(parent1), 1))
+    return np.where(np.arange(chromosome_length) < points, parent2, parent1)
+
+# Flips each bit with probability mutation_rate percent
+def mutate(population, mutation_rate, rng):
+    flips = rng.random(population.shape) < mutation_rate / 100
+    return population ^ flips.astype(population.dtype)
+
+# Chromosome bits packed into one integer key (bit i of the chromosome is
+# bit i of the key); chromosomes longer than 64 bits fall back to bytes
+def pack_chromosomes(population):
+    packed = np.packbits(np.asarray(population, dtype=np.uint8), axis=1, bitorder='little')
+    if packed.shape[1] > 8:
+        return [row.tobytes() for row in packed]
+    padded = np.zeros((len(packed), 8), dtype=np.uint8)
+    padded[:, :packed.shape[1]] = packed
+    return padded.view('<u8').ravel().tolist()
+
+# Bounded LRU map from packed chromosome to fitness. Only chromosomes not
+# seen before (and each of them once per population) are passed to
+# evaluate_fn. Must be cleared whenever the fitness function changes.
+class FitnessCache:
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lookups = 0
+        self.evaluated = 0
+        self.skipped_launches = 0
+
+    def clear(self):
+        self.entries.clear()
+
+    def evaluate(self, population, evaluate_fn):
+        keys = pack_chromosomes(population)
+        fitness = np.empty(len(keys), dtype=np.float32)
+        missing = OrderedDict()
+        for i, key in enumerate(keys):
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                fitness[i] = self.entries[key]
+            else:
+                missing.setdefault(key, []).append(i)
+        self.lookups += len(keys)
+        self.evaluated += len(missing)
+        if not missing:
+            self.skipped_launches += 1
+            return fitness
+        values = evaluate_fn(population[[indices[0] for indices in missing.values()]])
+        for (key, indices), value in zip(missing.items(), values):
+            fitness[indices] = value
+            self.entries[key] = value
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return fitness
+
+    def stats(self):
+        return {
+            'lookups': self.lookups,
+            'evaluated': self.evaluated,
+            'hit_rate': 1 - self.evaluated / self.lookups if self.lookups else 0.0,
+            'skipped_launches': self.skipped_launches,
+            'entries': len(self.entries)
+        }
+
+# Early stopping on a target fitness, on no improvement of the best fitness
+# for stagnation_window generations, or on a wall-clock budget in seconds
+class StopCriteria:
+    def __init__(self, stagnation_window=None, target_fitness=None, time_budget=None, min_improvement=0.0):
+        self.stagnation_window = stagnation_window
+        self.target_fitness = target_fitness
+        self.time_budget = time_budget
+        self.min_improvement = min_improvement
+        self.start()
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.best_fitness = -np.inf
+        self.stagnant_generations = 0
+
+    def update(self, best_fitness):
+        if best_fitness > self.best_fitness + self.min_improvement:
+            self.best_fitness = best_fitness
+            self.stagnant_generations = 0
+        else:
+            self.stagnant_generations += 1
+        if self.target_fitness is not None and self.best_fitness >= self.target_fitness:
+            return 'target_fitness'
+        if self.stagnation_window is not None and self.stagnant_generations >= self.stagnation_window:
+            return 'stagnation'
+        if self.time_budget is not None and time.perf_counter() - self.started >= self.time_budget:
+            return 'time_budget'
+        return None
+
+def make_run_report(num_generations, generations, stop_reason, fitness_cache):
+    return {
+        'generations': generations,
+        'generations_saved': num_generations - generations,
+        'stop_reason': stop_reason,
+        'fitness_cache': fitness_cache.stats() if fitness_cache is not None else None
+    }
+
+class NumpyEngine:
+    def __init__(self, population_size=100, chromosome_length=32, num_inputs=8, num_neurons=4,
+                 mutation_rate=5, seed=None, fitness_cache_size=None):
+        self.population_size = population_size
+        self.chromosome_length = chromosome_length
+        self.num_inputs = num_inputs
+        self.num_neurons = num_neurons
+        self.mutation_rate = mutation_rate
+        self.rng = np.random.default_rng(seed)
+        self.population = None
+        self.fitness_cache = FitnessCache(fitness_cache_size) if fitness_cache_size else None
+        self.run_report = None
+
+    def initialize_weights(self, weights=None, biases=None):
+        self.weights = (self.rng.random((self.num_neurons, self.num_inputs)) if weights is None else weights).astype(np.float32)
+        self.biases = (self.rng.random(self.num_neurons) if biases is None else biases).astype(np.float32)
+        if self.fitness_cache is not None:
+            self.fitness_cache.clear()
+
+    def initial_population(self):
+        return self.rng.integers(0, 2, size=(self.population_size, self.chromosome_length), dtype=np.int32)
+
+    # Same interface as NeuralGeneticScheduler: the GA step breeds from the
+    # population that was last evaluated
+    def evaluate_population(self, population):
+        self.population = population
+        if self.fitness_cache is not None:
+            return self.fitness_cache.evaluate(population, self.evaluate_chromosomes)
+        return self.evaluate_chromosomes(population)
+
+    def evaluate_chromosomes(self, chromosomes):
+        return neural_fitness(encode_population(chromosomes, self.num_inputs), self.weights, self.biases)
+
+    def run_genetic_algorithm(self, fitness, population=None):
+        if population is not None:
+            self.population = population
+        parents = roulette_select(fitness.astype(np.int32), 2 * self.population_size, self.rng)
+        children = crossover(self.population[parents[:self.population_size]],
+                             self.population[parents[self.population_size:]], self.rng)
+        return mutate(children, self.mutation_rate, self.rng)
+
+def run_generations(engine, population, num_generations, verbose=False, stop=None):
+    best_solution, best_fitness = None, -np.inf
+    generations, stop_reason = 0, None
+    if stop is not None:
+        stop.start()
+    for generation in range(num_generations):
+        fitness = engine.evaluate_population(population)
+        generations += 1
+        best = int(np.argmax(fitness))
+        if fitness[best] > best_fitness:
+            best_solution, best_fitness = population[best].copy(), float(fitness[best])
+        if verbose:
+            print(f"Generation {generation}: Best Fitness = {fitness[best]}")
+        stop_reason = stop.update(best_fitness) if stop is not None else None
+        if stop_reason is not None:
+            break
+        population = engine.run_genetic_algorithm(fitness, population)
+    engine.run_report = make_run_report(num_generations, generations, stop_reason,
+                                   getattr(engine, 'fitness_cache', None))
+    return best_solution, best_fitness
+
+def make_engine(backend='numpy', bitstream_path="neural_genetic_scheduler.bit", **kwargs):
+    if backend == 'numpy':
+        return NumpyEngine(**kwargs)
+    if backend == 'fpga':
+        from neural_genetic_scheduler import NeuralGeneticScheduler
+        return NeuralGeneticScheduler(bitstream_path, **kwargs)
+    raise ValueError(f"Unknown backend {backend!r}, expected 'numpy' or 'fpga'")
+
+def make_problem(seed, num_inputs=8, num_neurons=4):
+    rng = np.random.default_rng(seed)
+    return {
+        'seed': seed,
+        'weights': rng.random((num_neurons, num_inputs)).astype(np.float32),
+        'biases': rng.random(num_neurons).astype(np.float32)
+    }
+
+def solve_problem(problem, num_generations=100, stop=None, **engine_options):
+    weights = problem['weights']
+    engine = NumpyEngine(num_inputs=weights.shape[1], num_neurons=weights.shape[0],
+                         seed=problem.get('seed'), **engine_options)
+    engine.initialize_weights(weights, problem['biases'])
+    return run_generations(engine, engine.initial_population(), num_generations, stop=stop)
+
+# Solves independent instances on a process pool; results come back in the
+# order of problems
+def solve_batch(problems, num_generations=100, max_workers=None, chunksize=4, stop=None, **engine_options):
+    solve = partial(solve_problem, num_generations=num_generations, stop=stop, **engine_options)
+    if max_workers == 1:
+        return [solve(problem) for problem in problems]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(solve, problems, chunksize=chunksize))
+
+def benchmark_batch(num_problems=64, num_generations=100, max_workers=None):
+    problems = [make_problem(seed) for seed in range(num_problems)]
+    results = {}
+    for name, workers in (('serial', 1), ('process_pool', max_workers)):
+        start = time.perf_counter()
+        solutions = solve_batch(problems, num_generations, max_workers=workers)
+        elapsed = time.perf_counter() - start
+        results[name] = {'seconds': elapsed, 'problems_per_second': num_problems / elapsed}
+    results['best_fitness'] = [fitness for _, fitness in solutions]
+    return results
+
+if __name__ == "__main__":
+    results = benchmark_batch()
+    for name in ('serial', 'process_pool'):
+        print(f"{name}: {results[name]['seconds']:.2f} seconds, "
+              f"{results[name]['problems_per_second']:.1f} problems/second")
+    print(f"Mean best fitness: {np.mean(results['best_fitness']):.2f}")
@@ -1,79 +1,303 @@
-from pynq import Overlay
-from pynq import allocate
 import numpy as np
+import os
+import sys
 import time
 
+# Completion.py is shared with the Distributed Neural Network project and
+# only kept there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                             'Distributed Neural Network on FPGA Using Systolic Arrays'))
+from Completion import make_completion
+from genetic_engine import encode_population, FitnessCache, StopCriteria, make_run_report
+
+try:
+    from pynq import Overlay
+    from pynq import allocate
+except ImportError:
+    Overlay = None
+    allocate = None
+
+# Host-memory buffer exposing the same physical_address attribute as a
+# pynq buffer, for running against software stand-ins of the IP cores
+class SoftwareBuffer(np.ndarray):
+    @property
+    def physical_address(self):
+        return self.ctypes.data
+
+    def freebuffer(self):
+        pass
+
+def software_allocate(shape, dtype):
+    return np.zeros(shape, dtype=dtype).view(SoftwareBuffer)
+
 class NeuralGeneticScheduler:
-    def __init__(self, bitstream_path):
-        self.overlay = Overlay(bitstream_path)
-        self.neural_layer = self.overlay.neural_layer_0
-        self.genetic_algorithm = self.overlay.genetic_algorithm_0
+    def __init__(self, bitstream_path, completion='spin', cores=None, allocate_fn=None, reuse_buffers=True,
+                 fitness_cache_size=None, **completion_options):
+        if cores is None:
+            self.overlay = Overlay(bitstream_path)
+            self.neural_layer = self.overlay.neural_layer_0
+            self.genetic_algorithm = self.overlay.genetic_algorithm_0
+        else:
+            self.overlay = None
+            self.neural_layer, self.genetic_algorithm = cores
+        self.allocate_fn = allocate_fn or allocate or software_allocate
+        self.reuse_buffers = reuse_buffers
+        self.allocations = 0
+        self.buffers = {}
+        self.island_buffers = []
+        self.generation_times = []
+        self.core_busy = {'neural_layer': 0.0, 'genetic_algorithm': 0.0}
+        self.core_report = None
+        self.fitness_cache = FitnessCache(fitness_cache_size) if fitness_cache_size else None
+        self.run_report = None
+        
+        self.neural_layer_completion = make_completion(
+            completion, getattr(self.neural_layer, 'interrupt', None), **completion_options)
+        self.genetic_algorithm_completion = make_completion(
+            completion, getattr(self.genetic_algorithm, 'interrupt', None), **completion_options)
+        self.neural_layer_completion.prepare(self.neural_layer)
+        self.genetic_algorithm_completion.prepare(self.genetic_algorithm)
         
         self.population_size = 100
         self.chromosome_length = 32
         self.num_inputs = 8
         self.num_neurons = 4
         
-    def initialize_weights(self):
-        weights = np.random.rand(self.num_neurons, self.num_inputs).astype(np.float32)
-        biases = np.random.rand(self.num_neurons).astype(np.float32)
-        
-        weights_buffer = allocate(shape=(self.num_neurons, self.num_inputs), dtype=np.float32)
-        biases_buffer = allocate(shape=(self.num_neurons,), dtype=np.float32)
-        
-        np.copyto(weights_buffer, weights)
-        np.copyto(biases_buffer, biases)
+    def allocate(self, shape, dtype):
+        self.allocations += 1
+        return self.allocate_fn(shape=shape, dtype=dtype)
+    
+    def replace_buffer(self, name, shape, dtype):
+        if name in self.buffers:
+            self.buffers[name].freebuffer()
+        self.buffers[name] = self.allocate(shape, dtype)
+        return self.buffers[name]
+    
+    # Input/output buffers for each core, allocated once. With
+    # reuse_buffers=False they are replaced before every call instead, as the
+    # original per-generation code did.
+    def allocate_neural_layer_buffers(self):
+        self.replace_buffer('input', (self.population_size, self.num_inputs), np.float32)
+        self.replace_buffer('output', (self.population_size, self.num_neurons), np.float32)
+    
+    def allocate_genetic_algorithm_buffers(self):
+        self.replace_buffer('fitness', (self.population_size,), np.int32)
+        self.replace_buffer('population', (self.population_size, self.chromosome_length), np.int32)
+    
+    # The weight and bias buffers stay owned by the scheduler for as long as
+    # the neural layer holds their addresses
+    def initialize_weights(self, weights=None, biases=None):
+        weights = (np.random.rand(self.num_neurons, self.num_inputs) if weights is None else weights).astype(np.float32)
+        biases = (np.random.rand(self.num_neurons) if biases is None else biases).astype(np.float32)
         
-        self.neural_layer.write(0x10, weights_buffer.physical_address)
-        self.neural_layer.write(0x18, biases_buffer.physical_address)
+        if 'weights' not in self.buffers:
+            self.replace_buffer('weights', (self.num_neurons, self.num_inputs), np.float32)
+            self.replace_buffer('biases', (self.num_neurons,), np.float32)
         
-    def evaluate_population(self, population):
-        input_buffer = allocate(shape=(self.population_size, self.num_inputs), dtype=np.float32)
-        output_buffer = allocate(shape=(self.population_size, self.num_neurons), dtype=np.float32)
+        np.copyto(self.buffers['weights'], weights)
+        np.copyto(self.buffers['biases'], biases)
         
-        np.copyto(input_buffer, population.reshape(self.population_size, self.num_inputs))
+        self.neural_layer.write(0x10, self.buffers['weights'].physical_address)
+        self.neural_layer.write(0x18, self.buffers['biases'].physical_address)
+        if self.fitness_cache is not None:
+            self.fitness_cache.clear()
         
-        self.neural_layer.write(0x20, input_buffer.physical_address)
-        self.neural_layer.write(0x28, output_buffer.physical_address)
+    # Each core is driven in two halves, start and finish, so that the two
+    # cores can be kept busy at the same time (see solve_islands)
+    # The address registers are written on every start, since the shared
+    # buffers and the island buffers take turns on the same cores.
+    # Fewer than population_size chromosomes are zero padded; the core always
+    # scores a full buffer
+    def start_evaluation(self, buffers, population):
+        inputs = encode_population(population, self.num_inputs)
+        buffers['input'][:len(inputs)] = inputs
+        buffers['input'][len(inputs):] = 0
+        self.neural_layer.write(0x20, buffers['input'].physical_address)
+        self.neural_layer.write(0x28, buffers['output'].physical_address)
         self.neural_layer.write(0x00, 1)
-        
-        while (self.neural_layer.read(0x00) & 0x2) == 0:
-            pass
-        
-        fitness = np.sum(output_buffer, axis=1)
-        return fitness
+        return time.perf_counter()
     
-    def run_genetic_algorithm(self, fitness):
-        fitness_buffer = allocate(shape=(self.population_size,), dtype=np.int32)
-        population_buffer = allocate(shape=(self.population_size, self.chromosome_length), dtype=np.int32)
-        
-        np.copyto(fitness_buffer, fitness.astype(np.int32))
-        
-        self.genetic_algorithm.write(0x10, fitness_buffer.physical_address)
-        self.genetic_algorithm.write(0x18, population_buffer.physical_address)
+    def finish_evaluation(self, buffers, started):
+        self.neural_layer_completion.wait(self.neural_layer)
+        self.core_busy['neural_layer'] += time.perf_counter() - started
+        return np.sum(buffers['output'], axis=1)
+    
+    # The population buffer holds the parents on entry and the children on exit
+    def start_breeding(self, buffers, fitness, population=None):
+        np.copyto(buffers['fitness'], fitness.astype(np.int32))
+        if population is not None:
+            np.copyto(buffers['population'], population)
+        self.genetic_algorithm.write(0x10, buffers['fitness'].physical_address)
+        self.genetic_algorithm.write(0x18, buffers['population'].physical_address)
         self.genetic_algorithm.write(0x00, 1)
-        
-        while (self.genetic_algorithm.read(0x00) & 0x2) == 0:
-            pass
-        
-        return np.array(population_buffer)
+        return time.perf_counter()
+    
+    def finish_breeding(self, buffers, started):
+        self.genetic_algorithm_completion.wait(self.genetic_algorithm)
+        self.core_busy['genetic_algorithm'] += time.perf_counter() - started
+        return np.array(buffers['population'])
+    
+    # With a fitness cache only chromosomes not seen before are sent to the
+    # neural layer, and the core is not started at all when every one hits
+    def evaluate_population(self, population):
+        if self.fitness_cache is not None:
+            return self.fitness_cache.evaluate(population, self.evaluate_chromosomes)
+        return self.evaluate_chromosomes(population)
+    
+    def evaluate_chromosomes(self, chromosomes):
+        if not self.reuse_buffers or 'input' not in self.buffers:
+            self.allocate_neural_layer_buffers()
+        started = self.start_evaluation(self.buffers, chromosomes)
+        return self.finish_evaluation(self.buffers, started)[:len(chromosomes)]
+    
+    def run_genetic_algorithm(self, fitness, population=None):
+        if not self.reuse_buffers or 'fitness' not in self.buffers:
+            self.allocate_genetic_algorithm_buffers()
+        started = self.start_breeding(self.buffers, fitness, population)
+        return self.finish_breeding(self.buffers, started)
+    
+    def buffer_stats(self):
+        times = np.asarray(self.generation_times)
+        return {
+            'allocations': self.allocations,
+            'generations': len(times),
+            'allocations_per_generation': self.allocations / len(times) if len(times) else 0.0,
+            'mean_generation_time': float(times.mean()) if len(times) else 0.0,
+            'p99_generation_time': float(np.percentile(times, 99)) if len(times) else 0.0
+        }
+    
+    def close(self):
+        for buffers in [self.buffers] + self.island_buffers:
+            for buffer in buffers.values():
+                buffer.freebuffer()
+        self.buffers = {}
+        self.island_buffers = []
+    
+    def completion_stats(self):
+        return {
+            'neural_layer': self.neural_layer_completion.summary(),
+            'genetic_algorithm': self.genetic_algorithm_completion.summary()
+        }
     
-    def solve_scheduling_problem(self, num_generations):
+    def reset_core_busy(self):
+        self.core_busy = {core: 0.0 for core in self.core_busy}
+        return time.perf_counter()
+    
+    # Busy time runs from start until the host sees the done bit, not until
+    # the core actually finished. In islands mode the GA core is only waited
+    # on after the neural layer, so its figures are upper bounds.
+    def report_cores(self, started, **extra):
+        wall_time = time.perf_counter() - started
+        self.core_report = dict(extra, wall_time=wall_time, observed_busy=dict(self.core_busy),
+                                observed_utilization={core: busy / wall_time if wall_time > 0 else 0.0
+                                                      for core, busy in self.core_busy.items()})
+        return self.core_report
+    
+    # Runs up to num_generations, stopping early once the best fitness has not
+    # improved for stagnation_window generations, reaches target_fitness or
+    # time_budget seconds have passed
+    def solve_scheduling_problem(self, num_generations, stagnation_window=None, target_fitness=None,
+                                 time_budget=None):
         self.initialize_weights()
         population = np.random.randint(0, 2, size=(self.population_size, self.chromosome_length))
+        best_solution, best_fitness = None, -np.inf
+        stop = StopCriteria(stagnation_window, target_fitness, time_budget)
+        generations, stop_reason = 0, None
+        started = self.reset_core_busy()
         
         for generation in range(num_generations):
+            start = time.perf_counter()
             fitness = self.evaluate_population(population)
-            population = self.run_genetic_algorithm(fitness)
+            generations += 1
+            if np.max(fitness) > best_fitness:
+                best_solution = population[np.argmax(fitness)].copy()
+                best_fitness = np.max(fitness)
+            stop_reason = stop.update(best_fitness)
+            if stop_reason is None:
+                population = self.run_genetic_algorithm(fitness, population)
+            self.generation_times.append(time.perf_counter() - start)
+            
+            print(f"Generation {generation}: Best Fitness = {np.max(fitness)}")
+            if stop_reason is not None:
+                break
+        
+        self.report_cores(started, mode='alternating', generations=generations)
+        self.run_report = make_run_report(num_generations, generations, stop_reason, self.fitness_cache)
+        return best_solution, best_fitness
+    
+    def allocate_island_buffers(self):
+        buffers = {
+            'input': self.allocate((self.population_size, self.num_inputs), np.float32),
+            'output': self.allocate((self.population_size, self.num_neurons), np.float32),
+            'fitness': self.allocate((self.population_size,), np.int32),
+            'population': self.allocate((self.population_size, self.chromosome_length), np.int32)
+        }
+        self.island_buffers.append(buffers)
+        return buffers
+    
+    # Island model: num_islands populations evolve side by side and their
+    # steps are interleaved, so one island's fitness evaluation on the neural
+    # layer runs while the previous island is bred on the genetic algorithm
+    # core. Every migration_interval generations each island sends copies of
+    # its migration_size best chromosomes to the next island in the ring,
+    # replacing that island's worst.
+    def solve_islands(self, num_generations, num_islands=2, migration_interval=10, migration_size=2):
+        if num_islands < 2:
+            raise ValueError("The island model needs at least two islands to overlap the cores")
+        self.initialize_weights()
+        while len(self.island_buffers) < num_islands:
+            self.allocate_island_buffers()
+        islands = self.island_buffers[:num_islands]
+        populations = [np.random.randint(0, 2, size=(self.population_size, self.chromosome_length)).astype(np.int32)
+                       for _ in range(num_islands)]
+        emigrants = [None] * num_islands
+        best_solution, best_fitness = None, -np.inf
+        migrations = 0
+        breeding = None
+        started = self.reset_core_busy()
+        
+        num_steps = num_generations * num_islands
+        for step in range(num_steps + 1):
+            island = step % num_islands
+            generation = step // num_islands
+            if step < num_steps:
+                evaluation_started = self.start_evaluation(islands[island], populations[island])
+            if breeding is not None:
+                bred_island, bred_fitness = breeding
+                breeding_started = self.start_breeding(islands[bred_island], bred_fitness, populations[bred_island])
             
-            best_solution = population[np.argmax(fitness)]
-            best_fitness = np.max(fitness)
+            if step < num_steps:
+                fitness = self.finish_evaluation(islands[island], evaluation_started)
+            if breeding is not None:
+                populations[bred_island] = self.finish_breeding(islands[bred_island], breeding_started)
+                breeding = None
+            if step == num_steps:
+                break
             
-            print(f"Generation {generation}: Best Fitness = {best_fitness}")
+            population = populations[island]
+            if np.max(fitness) > best_fitness:
+                best_solution = population[np.argmax(fitness)].copy()
+                best_fitness = np.max(fitness)
+            if generation > 0 and generation % migration_interval == 0:
+                order = np.argsort(fitness)
+                outgoing = (population[order[-migration_size:]].copy(), fitness[order[-migration_size:]].copy())
+                incoming = emigrants[(island - 1) % num_islands]
+                if incoming is not None:
+                    population[order[:migration_size]], fitness[order[:migration_size]] = incoming
+                    migrations += 1
+                emigrants[island] = outgoing
+            breeding = (island, fitness)
         
+        self.report_cores(started, mode='islands', islands=num_islands, generations=num_generations,
+                          migrations=migrations)
         return best_solution, best_fitness
 
-scheduler = NeuralGeneticScheduler("neural_genetic_scheduler.bit")
-best_solution, best_fitness = scheduler.solve_scheduling_problem(num_generations=100)
-print(f"Best Solution: {best_solution}")
-print(f"Best Fitness: {best_fitness}")
\ No newline at end of file
+if __name__ == "__main__":
+    scheduler = NeuralGeneticScheduler("neural_genetic_scheduler.bit")
+    best_solution, best_fitness = scheduler.solve_scheduling_problem(num_generations=100)
+    print(f"Best Solution: {best_solution}")
+    print(f"Best Fitness: {best_fitness}")
+    print(f"Completion: {scheduler.completion_stats()}")
+    print(f"Buffers: {scheduler.buffer_stats()}")
+    print(f"Run: {scheduler.run_report}")
+    scheduler.close()
\ No newline at end of file
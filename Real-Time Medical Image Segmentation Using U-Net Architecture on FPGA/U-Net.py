@@ -5,11 +5,30 @@ import torch.optim as optim
 from torchvision import transforms
 from torch.utils.data import Dataset, DataLoader
 import numpy as np
+import os
 import time
 
+try:
+    from pynq import Overlay
+except ImportError:
+    Overlay = None
+
+# Assumed multi-channel accelerator datapath: 32-bit words (DATA_WIDTH of
+# conv2d_accelerator in FPGA Hardware Description.v) and 3x3 kernels, with
+# activations, weights and outputs in Q16.16 fixed point. The current RTL is
+# a single-channel integer conv with a wrapping 32-bit sum; it has no
+# fractional format, bias or input-channel accumulation.
+DATA_WIDTH = 32
+FRAC_BITS = 16
+KERNEL_SIZE = 3
+IMG_SIZE = 256
+BRAM_BLOCK_BITS = 36 * 1024
+FLOAT64_EXACT = 2**53
+
 class UNet(nn.Module):
-    def __init__(self):
+    def __init__(self, accelerator=None):
         super(UNet, self).__init__()
+        self.accelerator = accelerator
         
         # Encoder
         self.enc1 = self.conv_block(1, 64)
@@ -37,12 +56,19 @@ class UNet(nn.Module):
         
         self.final = nn.Conv2d(64, 1, 1)
         
+    # With an accelerator the 3x3 convolutions are FPGAConv2d; the module
+    # layout and parameter names are the same either way
+    def conv(self, in_ch, out_ch):
+        if self.accelerator is None:
+            return nn.Conv2d(in_ch, out_ch, 3, padding=1)
+        return FPGAConv2d(in_ch, out_ch, 3, padding=1, accelerator=self.accelerator)
+
     def conv_block(self, in_ch, out_ch):
         return nn.Sequential(
-            nn.Conv2d(in_ch, out_ch, 3, padding=1),
+            self.conv(in_ch, out_ch),
             nn.BatchNorm2d(out_ch),
             nn.ReLU(inplace=True),
-            nn.Conv2d(out_ch, out_ch, 3, padding=1),
+            self.conv(out_ch, out_ch),
             nn.BatchNorm2d(out_ch),
             nn.ReLU(inplace=True)
         )
@@ -84,10 +110,119 @@ class MedicalDataset(Dataset):
             
         return image, mask
 
+def to_fixed(x, frac_bits=FRAC_BITS, bits=DATA_WIDTH):
+    qmax = 2**(bits - 1) - 1
+    return torch.clamp(torch.round(x.detach().double() * 2**frac_bits), -qmax - 1, qmax)
+
+def from_fixed(q, frac_bits=FRAC_BITS):
+    return q.double() / 2**frac_bits
+
+# Tiled model of the assumed Q16.16 datapath above. Each output tile of
+# tile_size x tile_size pixels reads a (tile_size + k - 1)-square input
+# window (the line buffers hold the k - 1 halo rows), is turned into columns
+# with im2col and multiplied by the weight matrix. Q16.16 products are
+# accumulated exactly in a wide accumulator together with the bias, rounded
+# back to Q16.16 and saturated to 32 bits, so results do not depend on the
+# tiling. Operands are integer-valued float64, which is exact while the
+# accumulator bound stays under 2**53; otherwise the tile falls back to int64.
+class TiledConvEngine:
+    def __init__(self, tile_size=32, tile_in_channels=64, tile_out_channels=64, frac_bits=FRAC_BITS):
+        self.tile_size = tile_size
+        self.tile_in_channels = tile_in_channels
+        self.tile_out_channels = tile_out_channels
+        self.frac_bits = frac_bits
+        self.stats = {'calls': 0, 'tiles': 0, 'macs': 0, 'int64_tiles': 0, 'saturated': 0}
+
+    def output_tiles(self, height, width):
+        tile = self.tile_size or max(height, width)
+        for y in range(0, height, tile):
+            for x in range(0, width, tile):
+                yield y, x, min(tile, height - y), min(tile, width - x)
+
+    def conv2d(self, data, weights, bias=None, padding=1):
+        batch, in_ch, height, width = data.shape
+        out_ch, _, k, _ = weights.shape
+        out_h, out_w = height + 2 * padding - k + 1, width + 2 * padding - k + 1
+        qmax = 2**(DATA_WIDTH - 1) - 1
+        half = 2**(self.frac_bits - 1)
+
+        x = F.pad(to_fixed(data, self.frac_bits), (padding,) * 4)
+        w = to_fixed(weights, self.frac_bits).reshape(out_ch, -1)
+        b = torch.zeros(out_ch, dtype=torch.float64) if bias is None else to_fixed(bias, self.frac_bits)
+        b = (b * 2**self.frac_bits).reshape(1, out_ch, 1)
+        bound = float(x.abs().max()) * float(w.abs().sum(1).max()) + float(b.abs().max()) + half
+        exact = bound < FLOAT64_EXACT
+
+        out = torch.empty(batch, out_ch, out_h, out_w, dtype=torch.float64)
+        tiles = 0
+        for y, x0, th, tw in self.output_tiles(out_h, out_w):
+            cols = F.unfold(x[:, :, y:y + th + k - 1, x0:x0 + tw + k - 1], k)
+            if exact:
+                q = torch.floor((w @ cols + b + half) / 2**self.frac_bits)
+            else:
+                acc = w.long() @ cols.long() + b.long() + half
+                q = (acc >> self.frac_bits).double()
+            out[:, :, y:y + th, x0:x0 + tw] = q.reshape(batch, out_ch, th, tw)
+            tiles += 1
+
+        saturated = (out < -qmax - 1) | (out > qmax)
+        self.stats['calls'] += 1
+        self.stats['tiles'] += tiles
+        self.stats['macs'] += batch * out_ch * in_ch * k * k * out_h * out_w
+        self.stats['int64_tiles'] += 0 if exact else tiles
+        self.stats['saturated'] += int(saturated.sum())
+        out = out.clamp(-qmax - 1, qmax)
+        return from_fixed(out, self.frac_bits).to(data.dtype)
+
+    # Off-chip traffic of one same-padded layer under the loop order
+    # spatial tile -> output channel tile -> input channel tile. Partial sums
+    # stay on chip across input channel tiles, input windows are re-read for
+    # every output channel tile and weights for every spatial tile.
+    def traffic(self, in_ch, out_ch, height, width, k=KERNEL_SIZE, batch=1):
+        tiles = list(self.output_tiles(height, width))
+        out_ch_tiles = -(-out_ch // self.tile_out_channels)
+        tile_in, tile_out = min(self.tile_in_channels, in_ch), min(self.tile_out_channels, out_ch)
+        tile_h, tile_w = max(t[2] for t in tiles), max(t[3] for t in tiles)
+
+        input_words = batch * out_ch_tiles * in_ch * sum((h + k - 1) * (w + k - 1) for _, _, h, w in tiles)
+        weight_words = batch * len(tiles) * out_ch * in_ch * k * k
+        output_words = batch * out_ch * height * width
+        words = input_words + weight_words + output_words
+        macs = batch * out_ch * in_ch * k * k * height * width
+        buffer_words = (tile_in * (tile_h + k - 1) * (tile_w + k - 1) + tile_out * tile_in * k * k
+                        + tile_out * tile_h * tile_w)
+        return {
+            'tiles': len(tiles),
+            'macs': macs,
+            'input_words': input_words,
+            'weight_words': weight_words,
+            'output_words': output_words,
+            'offchip_bytes': words * DATA_WIDTH // 8,
+            'reuse': macs / words,
+            'line_buffer_words': tile_in * (k - 1) * (tile_w + k - 1),
+            'buffer_words': buffer_words,
+            'bram_blocks': -(-buffer_words * DATA_WIDTH // BRAM_BLOCK_BITS)
+        }
+
+# nn.Conv2d that trains on the float path and, in eval mode, runs through
+# the accelerator. Only stride 1, undilated, ungrouped kernels are supported.
+class FPGAConv2d(nn.Conv2d):
+    def __init__(self, in_channels, out_channels, kernel_size, padding=0, bias=True, accelerator=None):
+        if not isinstance(padding, int):
+            raise ValueError(f"FPGAConv2d needs symmetric integer padding, got {padding!r}")
+        super().__init__(in_channels, out_channels, kernel_size, padding=padding, bias=bias)
+        self.accelerator = accelerator if accelerator is not None else FPGAAccelerator()
+
+    def forward(self, x):
+        if self.training:
+            return super().forward(x)
+        return self.accelerator.accelerate_convolution(x, self.weight, self.bias, self.padding[0])
+
 class FPGAAccelerator:
-    def __init__(self):
+    def __init__(self, tile_size=32, tile_in_channels=64, tile_out_channels=64, frac_bits=FRAC_BITS):
         self.bitstream = None
         self.dma_engine = None
+        self.engine = TiledConvEngine(tile_size, tile_in_channels, tile_out_channels, frac_bits)
         
     def load_bitstream(self, bitstream_path):
         # Load FPGA bitstream
@@ -97,21 +232,82 @@ class FPGAAccelerator:
         # Configure DMA engine for data transfer
         self.dma_engine = self.setup_dma()
         
-    def accelerate_convolution(self, input_data, weights):
+    def accelerate_convolution(self, input_data, weights, bias=None, padding=1):
         # Hardware acceleration of convolution operations
-        return self.fpga_conv2d(input_data, weights)
+        return self.fpga_conv2d(input_data, weights, bias, padding)
     
+    # Without pynq or the bitstream file the accelerator stays on the CPU model
     def load_fpga_bitstream(self, path):
-        # FPGA bitstream loading implementation
-        pass
+        if Overlay is None or not os.path.exists(path):
+            return None
+        return Overlay(path)
     
     def setup_dma(self):
-        # DMA setup implementation
-        pass
+        return getattr(self.bitstream, 'axi_dma_0', None)
     
-    def fpga_conv2d(self, data, weights):
-        # FPGA-accelerated 2D convolution implementation
-        pass
+    # conv2d_accelerator takes its operands on plain ports rather than an
+    # AXI stream, so tiles are computed on the CPU by the model of the
+    # assumed Q16.16 datapath
+    def fpga_conv2d(self, data, weights, bias=None, padding=1):
+        return self.engine.conv2d(data, weights, bias, padding)
+
+def best_time(fn, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+# One U-Net sized layer through the tiled engine at several tile sizes
+# (None buffers the whole image, as conv2d_accelerator does) against
+# F.conv2d in float32
+def profile_convolution(in_ch=64, out_ch=64, size=128, tile_sizes=(8, 16, 32, 64, None), repeats=3, seed=0):
+    torch.manual_seed(seed)
+    data = torch.rand(1, in_ch, size, size)
+    conv = nn.Conv2d(in_ch, out_ch, 3, padding=1)
+    rows = []
+    with torch.no_grad():
+        reference = F.conv2d(data, conv.weight, conv.bias, padding=1)
+        torch_seconds = best_time(lambda: F.conv2d(data, conv.weight, conv.bias, padding=1), repeats)
+        for tile_size in tile_sizes:
+            engine = TiledConvEngine(tile_size)
+            seconds = best_time(lambda: engine.conv2d(data, conv.weight, conv.bias), repeats)
+            output = engine.conv2d(data, conv.weight, conv.bias)
+            rows.append(dict(engine.traffic(in_ch, out_ch, size, size),
+                             tile_size=tile_size or size,
+                             seconds=seconds,
+                             vs_torch=seconds / torch_seconds,
+                             max_abs_error=float((output - reference).abs().max())))
+    return {'torch_seconds': torch_seconds, 'layers': rows}
+
+def format_conv_profile(profile):
+    lines = [f"PyTorch F.conv2d: {profile['torch_seconds'] * 1e3:.1f} ms",
+             f"{'Tile':>6} {'ms':>8} {'x torch':>8} {'Reuse':>7} {'MB':>8} {'BRAM':>6} {'Max err':>9}"]
+    for row in profile['layers']:
+        lines.append(f"{row['tile_size']:>6} {row['seconds'] * 1e3:>8.1f} {row['vs_torch']:>8.2f} "
+                     f"{row['reuse']:>7.1f} {row['offchip_bytes'] / 2**20:>8.2f} {row['bram_blocks']:>6} "
+                     f"{row['max_abs_error']:>9.2e}")
+    return "\n".join(lines)
+
+# Modelled traffic of every 3x3 convolution in a UNet at one input size;
+# each conv_block runs at the resolution of its encoder level
+UNET_LEVELS = {'enc1': 0, 'enc2': 1, 'enc3': 2, 'enc4': 3, 'bridge': 4,
+               'dec1': 3, 'dec2': 2, 'dec3': 1, 'dec4': 0}
+
+def unet_conv_traffic(model, size=IMG_SIZE, engine=None):
+    engine = engine or TiledConvEngine()
+    layers = []
+    for block, level in UNET_LEVELS.items():
+        for index, module in enumerate(getattr(model, block)):
+            if isinstance(module, nn.Conv2d):
+                resolution = size >> level
+                layers.append(dict(engine.traffic(module.in_channels, module.out_channels, resolution, resolution),
+                                   name=f"{block}.{index}"))
+    total = {key: sum(layer[key] for layer in layers)
+             for key in ('macs', 'input_words', 'weight_words', 'output_words', 'offchip_bytes')}
+    total['reuse'] = total['macs'] / (total['input_words'] + total['weight_words'] + total['output_words'])
+    return {'layers': layers, 'total': total}
 
 def train_model(model, train_loader, criterion, optimizer, fpga_acc, num_epochs=10):
     model.train()
@@ -136,7 +332,11 @@ def train_model(model, train_loader, criterion, optimizer, fpga_acc, num_epochs=
         epoch_time = time.time() - start_time
         print(f'Epoch {epoch+1}/{num_epochs}, Loss: {epoch_loss/len(train_loader):.4f}, Time: {epoch_time:.2f}s')
 
-def inference(model, image, fpga_acc):
+def inference(model, image, fpga_acc, tile_size=None, overlap=0.25, batch_size=4, blend='gaussian'):
+    if tile_size is not None:
+        mask = sliding_window_inference(model, image, tile_size, overlap, batch_size, blend)
+        return torch.from_numpy(mask).float()[None, None]
+
     model.eval()
     with torch.no_grad():
         # Preprocess image
@@ -150,6 +350,239 @@ def inference(model, image, fpga_acc):
         
     return pred_mask
 
+# Grayscale images too large for memory are read through a memmap; .npy
+# files carry their own shape and dtype
+def load_memmap(path, shape=None, dtype=np.uint8):
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+BLEND_MODES = ('cosine', 'gaussian', 'constant')
+
+# Per-pixel weight of a tile's prediction. Weights fall towards the tile
+# border so overlapping tiles hand over smoothly, but never reach zero, so
+# pixels covered by a single tile at the image border keep their prediction.
+def blend_window(tile_size, mode='gaussian', sigma_scale=0.125):
+    position = np.arange(tile_size, dtype=np.float64) + 0.5
+    if mode == 'cosine':
+        profile = np.sin(np.pi * position / tile_size)**2
+    elif mode == 'gaussian':
+        profile = np.exp(-0.5 * ((position - tile_size / 2) / (sigma_scale * tile_size))**2)
+    elif mode == 'constant':
+        profile = np.ones(tile_size)
+    else:
+        raise ValueError(f"Unknown blend mode {mode!r}, expected one of {BLEND_MODES}")
+    return np.maximum(np.outer(profile, profile), 1e-4).astype(np.float32)
+
+# Tile origins along one axis: stride apart, with the last tile flush with
+# the far edge
+def tile_starts(length, tile_size, stride):
+    if length <= tile_size:
+        return [0]
+    starts = list(range(0, length - tile_size, stride))
+    return starts + [length - tile_size]
+
+def read_tile(image, y, x, tile_size, scale):
+    tile = np.asarray(image[y:y + tile_size, x:x + tile_size], dtype=np.float32) * scale
+    pad = ((0, tile_size - tile.shape[0]), (0, tile_size - tile.shape[1]))
+    return np.pad(tile, pad, mode='edge') if any(after for _, after in pad) else tile
+
+# Overlap-tiled inference with blended seams. Tiles are read from image
+# (an ndarray or memmap, H x W or H x W x 1) one tile row at a time and run
+# through model in batches. Blended probabilities are accumulated in a
+# tile_size-row band that is flushed to out as soon as no later tile row
+# can touch it, so apart from out, host memory is O(tile_size * width) and
+# model activations are bounded by batch_size tiles. out may be a memmap;
+# it holds the thresholded mask (uint8) or, with threshold=None, the
+# probabilities (float32). tile_size must be a multiple of 16.
+def sliding_window_inference(model, image, tile_size=256, overlap=0.25, batch_size=4, blend='gaussian',
+                             threshold=0.5, out=None):
+    if image.ndim == 3:
+        image = image[..., 0]
+    if tile_size % 16:
+        raise ValueError(f"Tile size {tile_size} is not a multiple of 16")
+    if not 0 <= overlap < 1:
+        raise ValueError(f"Overlap {overlap} must be in [0, 1)")
+    height, width = image.shape
+    if out is None:
+        out = np.empty((height, width), dtype=np.float32 if threshold is None else np.uint8)
+    scale = 1 / 255 if image.dtype == np.uint8 else 1.0
+    stride = max(1, int(round(tile_size * (1 - overlap))))
+    window = blend_window(tile_size, blend)
+    device = next(model.parameters()).device
+
+    ys, xs = tile_starts(height, tile_size, stride), tile_starts(width, tile_size, stride)
+    band_width = max(width, tile_size)
+    probabilities = np.zeros((tile_size, band_width), dtype=np.float32)
+    weights = np.zeros((tile_size, band_width), dtype=np.float32)
+
+    model.eval()
+    with torch.inference_mode():
+        for row, y in enumerate(ys):
+            for first in range(0, len(xs), batch_size):
+                batch_xs = xs[first:first + batch_size]
+                tiles = np.stack([read_tile(image, y, x, tile_size, scale) for x in batch_xs])
+                output = model(torch.from_numpy(tiles)[:, None].to(device))[:, 0].float().cpu().numpy()
+                for x, prediction in zip(batch_xs, output):
+                    probabilities[:, x:x + tile_size] += prediction * window
+                    weights[:, x:x + tile_size] += window
+
+            # Rows above the next tile row are final
+            done = (ys[row + 1] if row + 1 < len(ys) else height) - y
+            rows = min(done, height - y)
+            blended = probabilities[:rows, :width] / weights[:rows, :width]
+            out[y:y + rows] = blended if threshold is None else blended > threshold
+            probabilities = np.roll(probabilities, -done, axis=0)
+            weights = np.roll(weights, -done, axis=0)
+            probabilities[tile_size - done:] = 0
+            weights[tile_size - done:] = 0
+    return out
+
+# Eval-mode BatchNorm folded into the preceding convolution
+def fold_conv_bn(conv, bn):
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    bias = conv.bias if conv.bias is not None else torch.zeros_like(bn.running_mean)
+    return (conv.weight * scale.reshape(-1, 1, 1, 1)).detach().clone(), \
+           ((bias - bn.running_mean) * scale + bn.bias).detach().clone()
+
+UNET_ENCODER = ('enc1', 'enc2', 'enc3', 'enc4')
+UNET_DECODER = (('up1', 'dec1'), ('up2', 'dec2'), ('up3', 'dec3'), ('up4', 'dec4'))
+
+# Frozen copy of a UNet for batched inference. BatchNorm is folded into the
+# convolutions, weights are kept in channels_last layout if requested, and
+# ReLU runs in place. Per input shape the engine allocates the input, one
+# concatenation buffer per skip connection (encoder features are written
+# into the upper half, upsampled decoder features into the lower half, so
+# no torch.cat is needed) and the probability and mask outputs. Results are
+# those buffers: they are overwritten by the next call with the same shape.
+class UNetInferenceEngine:
+    def __init__(self, model, channels_last=True, threshold=0.5):
+        self.memory_format = torch.channels_last if channels_last else torch.contiguous_format
+        self.threshold = threshold
+        self.buffers = {}
+        with torch.no_grad():
+            self.blocks = {name: [self.frozen(*fold_conv_bn(block[i], block[i + 1])) for i in (0, 3)]
+                           for name, block in ((name, getattr(model, name)) for name in UNET_LEVELS)}
+            self.ups = {up: self.frozen(getattr(model, up).weight, getattr(model, up).bias)
+                        for up, _ in UNET_DECODER}
+            self.final = self.frozen(model.final.weight, model.final.bias)
+
+    def frozen(self, weight, bias):
+        return weight.detach().contiguous(memory_format=self.memory_format), bias.detach().clone()
+
+    def allocate(self, batch, height, width):
+        key = (batch, height, width)
+        if key not in self.buffers:
+            def empty(channels, level=0):
+                return torch.empty(batch, channels, height >> level, width >> level).contiguous(
+                    memory_format=self.memory_format)
+            self.buffers[key] = {
+                'input': empty(1),
+                'skips': [empty(2 * self.blocks[name][1][0].shape[0], level)
+                          for level, name in enumerate(UNET_ENCODER)],
+                'probabilities': torch.empty(batch, 1, height, width),
+                'mask': torch.empty(batch, 1, height, width)
+            }
+        return self.buffers[key]
+
+    def buffer_bytes(self):
+        return sum(tensor.nbytes for buffers in self.buffers.values()
+                   for value in buffers.values() for tensor in (value if isinstance(value, list) else [value]))
+
+    def conv_block(self, x, name):
+        for weight, bias in self.blocks[name]:
+            x = F.conv2d(x, weight, bias, padding=1).relu_()
+        return x
+
+    def forward(self, x, skips):
+        for name, skip in zip(UNET_ENCODER, skips):
+            features = self.conv_block(x, name)
+            skip[:, skip.shape[1] // 2:].copy_(features)
+            x = F.max_pool2d(features, 2)
+        x = self.conv_block(x, 'bridge')
+        for (up, dec), skip in zip(UNET_DECODER, reversed(skips)):
+            skip[:, :skip.shape[1] // 2].copy_(F.conv_transpose2d(x, *self.ups[up], stride=2))
+            x = self.conv_block(skip, dec)
+        return F.conv2d(x, *self.final)
+
+    # images: one H x W image, a B x H x W (x 1) array or a list of H x W
+    # arrays; uint8 is scaled to [0, 1] like transforms.ToTensor
+    def __call__(self, images, probabilities=False):
+        images = np.stack(images) if isinstance(images, (list, tuple)) else np.asarray(images)
+        if images.ndim == 4:
+            images = images[..., 0]
+        if images.ndim == 2:
+            images = images[None]
+        batch, height, width = images.shape
+        if height % 16 or width % 16:
+            raise ValueError(f"Image size {height}x{width} is not a multiple of 16")
+        buffers = self.allocate(batch, height, width)
+        with torch.inference_mode():
+            x = buffers['input']
+            x.copy_(torch.from_numpy(images)[:, None])
+            if images.dtype == np.uint8:
+                x.mul_(1 / 255)
+            torch.sigmoid(self.forward(x, buffers['skips']), out=buffers['probabilities'])
+            torch.gt(buffers['probabilities'], self.threshold, out=buffers['mask'])
+        return buffers['probabilities'] if probabilities else buffers['mask']
+
+# Allocated bytes and peak live bytes of fn, from the profiler's per-op
+# memory accounting in execution order
+def profile_memory(fn):
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    with torch.profiler.profile(activities=activities, profile_memory=True) as profiler:
+        fn()
+    live = peak = allocated = 0
+    for event in sorted(profiler.events(), key=lambda event: event.time_range.start):
+        usage = event.self_cpu_memory_usage
+        allocated += max(usage, 0)
+        live += usage
+        peak = max(peak, live)
+    return {'allocated_bytes': allocated, 'peak_bytes': peak}
+
+# Current inference() path, in both layouts, against the engine in both
+# layouts. Convolutions dominate, so the channels_last baseline is what
+# separates the layout speedup from the engine's own (folded BN, no
+# torch.cat). Paths are timed interleaved so machine noise hits them all.
+# The engine's persistent buffers are reported separately from its
+# per-call memory.
+def benchmark_inference(model, sizes=(256, 512), batch_size=1, repeats=5, seed=0):
+    rng = np.random.default_rng(seed)
+    model.eval()
+    model_channels_last = UNet().to(memory_format=torch.channels_last).eval()
+    model_channels_last.load_state_dict(model.state_dict())
+    engines = {'engine': UNetInferenceEngine(model, channels_last=False),
+               'engine_channels_last': UNetInferenceEngine(model, channels_last=True)}
+    results = []
+    for size in sizes:
+        images = (rng.random((batch_size, size, size)) * 255).astype(np.uint8)
+        with torch.no_grad():
+            reference = model(torch.from_numpy(images)[:, None].float() / 255)
+        paths = {'current': lambda: [inference(model, image, None) for image in images],
+                 'current_channels_last': lambda: [inference(model_channels_last, image, None)
+                                                   for image in images]}
+        paths.update({name: (lambda engine=engine: engine(images)) for name, engine in engines.items()})
+        seconds = {name: float('inf') for name in paths}
+        for _ in range(repeats):
+            for name, run in paths.items():
+                seconds[name] = min(seconds[name], best_time(run, 1))
+        for name, run in paths.items():
+            row = dict(profile_memory(run), size=size, batch_size=batch_size, path=name, seconds=seconds[name])
+            if name in engines:
+                probabilities = engines[name](images, probabilities=True)
+                row['max_probability_error'] = float((probabilities - reference).abs().max())
+                row['buffer_bytes'] = engines[name].buffer_bytes()
+            results.append(row)
+    return results
+
+def format_inference_benchmark(results):
+    lines = [f"{'Size':>6} {'Path':<22} {'ms':>8} {'Alloc MB':>9} {'Peak MB':>8} {'Buffers MB':>11}"]
+    for row in results:
+        lines.append(f"{row['size']:>6} {row['path']:<22} {row['seconds'] * 1e3:>8.1f} "
+                     f"{row['allocated_bytes'] / 2**20:>9.1f} {row['peak_bytes'] / 2**20:>8.1f} "
+                     f"{row.get('buffer_bytes', 0) / 2**20:>11.1f}")
+    return "\n".join(lines)
+
 def main():
     # Initialize FPGA accelerator
     fpga_acc = FPGAAccelerator()
@@ -8,6 +8,27 @@ import torchvision
 import numpy as np
 from collections import OrderedDict
 import json
+import math
+import os
+import time
+
+BRAM_BLOCK_BITS = 36 * 1024
+
+# Binary model image: a header, one fixed-size table entry per layer, then
+# for each layer its weight block, float32 per-output-channel scales,
+# float32 bias and bit-packed mask. Blocks start on IMAGE_ALIGNMENT byte
+# boundaries and everything is little-endian, so the file can be
+# np.memmap-ed and every block viewed in place.
+IMAGE_MAGIC = b'RCNNIMG1'
+IMAGE_ALIGNMENT = 64
+IMAGE_HEADER = np.dtype([('magic', 'S8'), ('version', '<u4'), ('num_layers', '<u4'), ('table_offset', '<u8')])
+IMAGE_LAYER = np.dtype([
+    ('name', 'S32'), ('in_channels', '<u4'), ('out_channels', '<u4'), ('kernel_size', '<u4'),
+    ('stride', '<u4'), ('padding', '<u4'), ('weight_type', '<u4'),
+    ('weight_offset', '<u8'), ('scale_offset', '<u8'), ('bias_offset', '<u8'),
+    ('mask_offset', '<u8'), ('mask_nbytes', '<u8')
+])
+WEIGHT_TYPES = {'int8': (1, np.dtype('<i1')), 'int16': (2, np.dtype('<i2')), 'fp16': (3, np.dtype('<f2'))}
 
 # Hardware Configuration Parameters
 class FPGAConfig:
@@ -16,6 +37,9 @@ class FPGAConfig:
         self.available_bram = 2160  # In terms of 36Kb blocks
         self.clock_freq = 200e6    # 200 MHz
         self.power_budget = 20     # 20W
+        self.weight_bits = 16      # Fixed-point weights held in BRAM
+        self.activation_bits = 16  # Fixed-point line buffers
+        self.target_fps = None     # Optional throughput the pruned design must reach
 
 # Dynamic Pruning Parameters        
 class PruningConfig:
@@ -23,6 +47,27 @@ class PruningConfig:
         self.prune_rate = 0.5
         self.sensitivity_threshold = 0.1
         self.min_channels = 8
+        # Sensitivity is measured on a fixed subset of the training data;
+        # 'accuracy' prunes each layer and re-runs the downstream layers,
+        # 'taylor' is a single forward/backward first-order loss estimate
+        self.sensitivity_method = 'accuracy'
+        self.calibration_samples = 1024
+        self.calibration_batch_size = 256
+        # Budget solver: channels are removed prune_step of a layer at a time
+        # while the sensitivity-estimated accuracy loss stays within
+        # max_accuracy_loss (resource budgets are met first regardless)
+        self.prune_step = 0.125
+        self.max_accuracy_loss = 0.05
+        # Taylor sensitivities are cross-entropy increases rather than
+        # accuracy drops, so they are gated by their own threshold and budget
+        self.taylor_sensitivity_threshold = 0.2
+        self.max_taylor_loss = 0.1
+        
+    # (sensitivity threshold, loss budget) in the units of sensitivity_method
+    def sensitivity_limits(self):
+        if self.sensitivity_method == 'taylor':
+            return self.taylor_sensitivity_threshold, self.max_taylor_loss
+        return self.sensitivity_threshold, self.max_accuracy_loss
         
 # Reconfigurable Layer Implementation
 class ReconfigurableConv2d(nn.Module):
@@ -38,31 +83,98 @@ class ReconfigurableConv2d(nn.Module):
         self.conv = nn.Conv2d(in_channels, out_channels, kernel_size, 
                              stride=stride, padding=padding)
         
-        # Mask for pruning
+        # Mask for pruning; masked is cleared once pruned channels have been
+        # physically removed by compact()
         self.mask = torch.ones_like(self.conv.weight.data)
+        self.masked = False
+        
+    # Resource utilization tracking, live with respect to the mask: DSPs to
+    # compute one output pixel per cycle and weight storage in KB. in_channels
+    # can be lowered to the number of inputs the previous layer still produces.
+    @property
+    def dsp_usage(self):
+        return self.calculate_dsp_usage()
+        
+    @property
+    def bram_usage(self):
+        return self.calculate_bram_usage()
         
-        # Resource utilization tracking
-        self.dsp_usage = self.calculate_dsp_usage()
-        self.bram_usage = self.calculate_bram_usage()
+    def calculate_dsp_usage(self, in_channels=None):
+        in_channels = self.in_channels if in_channels is None else in_channels
+        return in_channels * self.active_channels() * self.kernel_size * self.kernel_size
         
-    def calculate_dsp_usage(self):
-        return self.in_channels * self.out_channels * self.kernel_size * self.kernel_size
+    def calculate_bram_usage(self, in_channels=None):
+        return (self.calculate_dsp_usage(in_channels) * 4) // 1024
         
-    def calculate_bram_usage(self):
-        return (self.in_channels * self.out_channels * self.kernel_size * self.kernel_size * 4) // 1024
+    def active_channels(self):
+        return int(self.mask.flatten(1).any(dim=1).sum())
         
     def forward(self, x):
-        # Apply mask during forward pass
+        if not self.masked:
+            return self.conv(x)
+        # Apply mask during forward pass; a pruned channel's bias is masked
+        # too so that it outputs zero, exactly as if it had been removed
         masked_weight = self.conv.weight * self.mask
-        return nn.functional.conv2d(x, masked_weight, self.conv.bias,
+        masked_bias = self.conv.bias * self.mask[:, 0, 0, 0]
+        return nn.functional.conv2d(x, masked_weight, masked_bias,
                                   stride=self.stride, padding=self.padding)
                                   
+    # prune_rate is the fraction of the layer's channels left pruned, so
+    # pruning at the same rate again changes nothing
     def prune_channels(self, prune_rate):
+        self.prune_to(self.out_channels - int(prune_rate * self.out_channels))
+        
+    def prune_to(self, num_channels):
+        with torch.no_grad():
+            self.mask[self.channels_to_prune(1 - num_channels / self.out_channels)] = 0
+            self.masked = True
+            
+    # Importance is the norm of the masked weights, so channels that are
+    # already pruned are always the first to be selected
+    def channels_to_prune(self, prune_rate):
+        weight_importance = (self.conv.weight.data * self.mask).flatten(1).norm(dim=1)
+        num_to_prune = int(round(prune_rate * len(weight_importance)))
+        return torch.topk(weight_importance, num_to_prune, largest=False)[1]
+        
+    # The num_channels least important channels that are still active
+    def next_channels_to_prune(self, num_channels):
+        importance = (self.conv.weight.data * self.mask).flatten(1).norm(dim=1)
+        importance[~self.mask.flatten(1).any(dim=1)] = float('inf')
+        return torch.topk(importance, min(num_channels, self.active_channels()), largest=False)[1]
+            
+    def kept_channels(self):
+        keep = torch.nonzero(self.mask.flatten(1).any(dim=1)).flatten()
+        if len(keep) == 0:
+            keep = torch.argmax(self.conv.weight.data.flatten(1).norm(dim=1)).reshape(1)
+        return keep
+        
+    def rebuild(self, weight, bias):
+        self.out_channels, self.in_channels = weight.shape[:2]
+        self.conv = nn.Conv2d(self.in_channels, self.out_channels, self.kernel_size,
+                             stride=self.stride, padding=self.padding).to(weight.device)
+        with torch.no_grad():
+            self.conv.weight.copy_(weight)
+            self.conv.bias.copy_(bias)
+        
+    # Physically removes the pruned output channels; returns the indices of
+    # the channels that were kept so the next layer can drop its inputs. The
+    # bias is masked as in forward, so a fully pruned layer's fallback
+    # channel still outputs zero.
+    def compact(self):
+        keep = self.kept_channels()
+        with torch.no_grad():
+            weight = (self.conv.weight * self.mask)[keep]
+            bias = (self.conv.bias * self.mask[:, 0, 0, 0])[keep]
+        self.mask = torch.ones_like(weight)
+        self.masked = False
+        self.rebuild(weight, bias)
+        return keep
+        
+    def compact_inputs(self, keep):
+        mask = self.mask[:, keep]
         with torch.no_grad():
-            weight_importance = torch.norm(self.conv.weight.data, dim=(1,2,3))
-            num_to_prune = int(prune_rate * len(weight_importance))
-            _, indices = torch.topk(weight_importance, num_to_prune, largest=False)
-            self.mask[indices] = 0
+            self.rebuild(self.conv.weight[:, keep], self.conv.bias)
+        self.mask = mask.contiguous()
             
 # Reconfigurable CNN Model
 class ReconfigurableCNN(nn.Module):
@@ -82,43 +194,186 @@ class ReconfigurableCNN(nn.Module):
         self.fc1 = nn.Linear(512 * 2 * 2, 1024)
         self.fc2 = nn.Linear(1024, 10)
         self.dropout = nn.Dropout(0.5)
+        self.input_size = 32
         
     def forward(self, x):
-        x = self.pool(torch.relu(self.layers['conv1'](x)))
-        x = self.pool(torch.relu(self.layers['conv2'](x)))
-        x = self.pool(torch.relu(self.layers['conv3'](x)))
-        x = self.pool(torch.relu(self.layers['conv4'](x)))
+        return self.forward_from(next(iter(self.layers)), x)
         
-        x = x.view(-1, 512 * 2 * 2)
+    # Runs the network from the input of layer `name` onwards
+    def forward_from(self, name, x):
+        names = list(self.layers)
+        for layer_name in names[names.index(name):]:
+            x = self.pool(torch.relu(self.layers[layer_name](x)))
+        return self.classify(x)
+        
+    # The input of every conv layer, plus the logits
+    def layer_inputs(self, x):
+        inputs = OrderedDict()
+        for name, layer in self.layers.items():
+            inputs[name] = x
+            x = self.pool(torch.relu(layer(x)))
+        return inputs, self.classify(x)
+        
+    def classify(self, x):
+        x = x.view(x.size(0), self.fc1.in_features)
         x = torch.relu(self.fc1(x))
         x = self.dropout(x)
         x = self.fc2(x)
         return x
         
+    # Counts only the channels that survive pruning, on both sides of a layer
     def get_resource_usage(self):
-        total_dsp = sum(layer.dsp_usage for layer in self.layers.values())
-        total_bram = sum(layer.bram_usage for layer in self.layers.values())
+        total_dsp = total_bram = 0
+        in_channels = None
+        for layer in self.layers.values():
+            total_dsp += layer.calculate_dsp_usage(in_channels)
+            total_bram += layer.calculate_bram_usage(in_channels)
+            in_channels = layer.active_channels()
         return {'dsp': total_dsp, 'bram': total_bram}
         
+    # Removes pruned channels from every layer and shrinks the input side of
+    # whatever consumes them (the next conv, or fc1 for the last conv). The
+    # compacted model computes the same outputs as the masked one.
+    def compact(self):
+        summary = OrderedDict()
+        layers = list(self.layers.items())
+        for i, (name, layer) in enumerate(layers):
+            before = layer.out_channels
+            keep = layer.compact()
+            if i + 1 < len(layers):
+                layers[i + 1][1].compact_inputs(keep)
+            else:
+                self.compact_fc1(keep, before)
+            summary[name] = {'channels_before': before, 'channels_after': layer.out_channels}
+        return summary
+        
+    # fc1 sees the last conv's output flattened as (channel, height, width)
+    def compact_fc1(self, keep, channels):
+        spatial = self.fc1.in_features // channels
+        columns = (keep[:, None] * spatial + torch.arange(spatial, device=keep.device)).flatten()
+        fc1 = nn.Linear(len(columns), self.fc1.out_features).to(self.fc1.weight.device)
+        with torch.no_grad():
+            fc1.weight.copy_(self.fc1.weight[:, columns])
+            fc1.bias.copy_(self.fc1.bias)
+        self.fc1 = fc1
+        
+def measure_latency(model, batch_size=1, iterations=50, warmup=5):
+    model.eval()
+    inputs = torch.randn(batch_size, 3, 32, 32)
+    with torch.no_grad():
+        for _ in range(warmup):
+            model(inputs)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            model(inputs)
+    return (time.perf_counter() - start) / iterations
+        
 # Dynamic Pruning Manager
 class DynamicPruningManager:
     def __init__(self, model, pruning_config):
         self.model = model
         self.config = pruning_config
         self.sensitivity_map = {}
+        self.measured_channels = {}
+        self.calibration = None
+        self.activation_cache = None
+        
+    # The first calibration_samples training samples, drawn once and kept
+    # for every later sensitivity update
+    def calibration_batches(self, dataloader):
+        if self.calibration is None:
+            inputs, labels, count = [], [], 0
+            for batch_inputs, batch_labels in dataloader:
+                inputs.append(batch_inputs)
+                labels.append(batch_labels)
+                count += len(batch_labels)
+                if count >= self.config.calibration_samples:
+                    break
+            inputs = torch.cat(inputs)[:self.config.calibration_samples]
+            labels = torch.cat(labels)[:self.config.calibration_samples]
+            size = self.config.calibration_batch_size
+            self.calibration = [(inputs[i:i+size], labels[i:i+size]) for i in range(0, len(labels), size)]
+        return self.calibration
+        
+    # Caches the input of every layer for the calibration batches and returns
+    # the unpruned accuracy; valid until the weights change
+    def cache_activations(self, batches):
+        self.model.eval()
+        self.activation_cache = {name: [] for name in self.model.layers}
+        correct = total = 0
+        with torch.no_grad():
+            for inputs, labels in batches:
+                layer_inputs, outputs = self.model.layer_inputs(inputs)
+                for name, activation in layer_inputs.items():
+                    self.activation_cache[name].append(activation)
+                correct += outputs.argmax(1).eq(labels).sum().item()
+                total += labels.size(0)
+        return correct / total
+        
+    # Sensitivity is measured for the solver's next step: prune_step of the
+    # layer's channels removed on top of those already pruned. It is the loss
+    # per fraction of the layer's channels removed, and measured_channels
+    # records how far down the measurement reaches. A layer with nothing left
+    # to remove keeps its last measured value.
+    def sensitivity_step(self, name):
+        layer = self.model.layers[name]
+        step = max(1, int(self.config.prune_step * layer.out_channels))
+        indices = layer.next_channels_to_prune(min(step, layer.active_channels() - 1))
+        if len(indices):
+            self.measured_channels[name] = layer.active_channels() - len(indices)
+        return indices
         
-    def calculate_layer_sensitivity(self, layer, dataloader):
-        original_accuracy = self.evaluate_accuracy(dataloader)
-        original_mask = layer.mask.clone()
+    def calculate_layer_sensitivity(self, name, batches, original_accuracy):
+        layer = self.model.layers[name]
+        indices = self.sensitivity_step(name)
+        if len(indices) == 0:
+            return self.sensitivity_map.get(name, 0.0)
+        original_mask, original_masked = layer.mask.clone(), layer.masked
         
-        layer.prune_channels(self.config.prune_rate)
-        pruned_accuracy = self.evaluate_accuracy(dataloader)
+        layer.mask[indices] = 0
+        layer.masked = True
+        correct = total = 0
+        with torch.no_grad():
+            for activation, (_, labels) in zip(self.activation_cache[name], batches):
+                outputs = self.model.forward_from(name, activation)
+                correct += outputs.argmax(1).eq(labels).sum().item()
+                total += labels.size(0)
+        pruned_accuracy = correct / total
         
-        sensitivity = (original_accuracy - pruned_accuracy) / self.config.prune_rate
-        layer.mask = original_mask
+        sensitivity = (original_accuracy - pruned_accuracy) / (len(indices) / layer.out_channels)
+        layer.mask, layer.masked = original_mask, original_masked
         
         return sensitivity
         
+    # First-order Taylor estimate of the loss increase from zeroing each
+    # output channel, |sum(activation * gradient)| averaged over samples,
+    # from one forward/backward pass over the calibration batches
+    def taylor_channel_scores(self, batches):
+        self.model.eval()
+        criterion = nn.CrossEntropyLoss(reduction='sum')
+        scores = {name: 0 for name in self.model.layers}
+        total = 0
+        for inputs, labels in batches:
+            outputs = OrderedDict()
+            x = inputs
+            with torch.enable_grad():
+                for name, layer in self.model.layers.items():
+                    outputs[name] = layer(x)
+                    x = self.model.pool(torch.relu(outputs[name]))
+                loss = criterion(self.model.classify(x), labels)
+                gradients = torch.autograd.grad(loss, list(outputs.values()))
+            for (name, output), gradient in zip(outputs.items(), gradients):
+                scores[name] = scores[name] + (output * gradient).sum(dim=(2, 3)).abs().sum(dim=0).detach()
+            total += labels.size(0)
+        return {name: score / total for name, score in scores.items()}
+        
+    def taylor_sensitivity(self, name, channel_scores):
+        layer = self.model.layers[name]
+        indices = self.sensitivity_step(name)
+        if len(indices) == 0:
+            return self.sensitivity_map.get(name, 0.0)
+        return channel_scores[indices].sum().item() / (len(indices) / layer.out_channels)
+        
     def evaluate_accuracy(self, dataloader):
         self.model.eval()
         correct = 0
@@ -134,13 +389,35 @@ class DynamicPruningManager:
         return correct / total
         
     def update_sensitivity_map(self, dataloader):
-        for name, layer in self.model.layers.items():
-            self.sensitivity_map[name] = self.calculate_layer_sensitivity(layer, dataloader)
+        batches = self.calibration_batches(dataloader)
+        if self.config.sensitivity_method == 'taylor':
+            channel_scores = self.taylor_channel_scores(batches)
+            for name in self.model.layers:
+                self.sensitivity_map[name] = self.taylor_sensitivity(name, channel_scores[name])
+        else:
+            original_accuracy = self.cache_activations(batches)
+            for name in self.model.layers:
+                self.sensitivity_map[name] = self.calculate_layer_sensitivity(name, batches, original_accuracy)
+            self.activation_cache = None
             
-    def prune_network(self):
-        for name, layer in self.model.layers.items():
-            if self.sensitivity_map[name] < self.config.sensitivity_threshold:
-                layer.prune_channels(self.config.prune_rate)
+    # Prunes every layer towards prune_rate in prune_step increments, the
+    # perturbation its sensitivity was measured for, re-measuring between
+    # rounds; a layer stops once its sensitivity reaches the threshold
+    def prune_network(self, dataloader):
+        threshold, _ = self.config.sensitivity_limits()
+        targets = {name: layer.out_channels - int(self.config.prune_rate * layer.out_channels)
+                   for name, layer in self.model.layers.items()}
+        while True:
+            pruned = False
+            for name, layer in self.model.layers.items():
+                active = layer.active_channels()
+                if active > targets[name] and self.sensitivity_map[name] < threshold:
+                    step = max(1, int(self.config.prune_step * layer.out_channels))
+                    layer.prune_to(max(targets[name], active - step))
+                    pruned = True
+            if not pruned:
+                break
+            self.update_sensitivity_map(dataloader)
                 
 # FPGA Resource Manager
 class FPGAResourceManager:
@@ -148,21 +425,118 @@ class FPGAResourceManager:
         self.config = fpga_config
         self.current_dsp = 0
         self.current_bram = 0
+        self.resource_table = None
+        
+    # Cost of the model as a layer-pipelined dataflow design. Each layer gets
+    # DSPs in proportion to its MACs (at most one output pixel per cycle),
+    # holds its fixed-point weights and a (k-1)-row line buffer in BRAM, and
+    # the slowest layer sets the frame rate. channels maps layer name to the
+    # number of surviving output channels, defaulting to the current masks.
+    def estimate(self, model, channels=None):
+        if channels is None:
+            channels = {name: layer.active_channels() for name, layer in model.layers.items()}
+        layers = OrderedDict()
+        in_channels, size = next(iter(model.layers.values())).in_channels, model.input_size
+        for name, layer in model.layers.items():
+            out_size = (size + 2 * layer.padding - layer.kernel_size) // layer.stride + 1
+            weights = in_channels * channels[name] * layer.kernel_size * layer.kernel_size
+            line_buffer = (layer.kernel_size - 1) * size * in_channels
+            layers[name] = {
+                'in_channels': in_channels,
+                'out_channels': channels[name],
+                'macs': weights * out_size * out_size,
+                'max_dsp': weights,
+                'bram': (math.ceil(weights * self.config.weight_bits / BRAM_BLOCK_BITS) +
+                         math.ceil(line_buffer * self.config.activation_bits / BRAM_BLOCK_BITS))
+            }
+            in_channels, size = channels[name], out_size // 2
+        
+        total_macs = sum(layer['macs'] for layer in layers.values())
+        for layer in layers.values():
+            layer['dsp'] = max(1, min(layer['max_dsp'], self.config.available_dsp * layer['macs'] // total_macs))
+            layer['cycles'] = math.ceil(layer['macs'] / layer['dsp'])
+            layer['latency'] = layer['cycles'] / self.config.clock_freq
+        return {
+            'layers': layers,
+            'dsp': sum(layer['dsp'] for layer in layers.values()),
+            'bram': sum(layer['bram'] for layer in layers.values()),
+            'fps': self.config.clock_freq / max(layer['cycles'] for layer in layers.values()),
+            'latency': sum(layer['latency'] for layer in layers.values())
+        }
+        
+    # How far an estimate is outside the DSP/BRAM budgets and the target
+    # frame rate, as a sum of relative overshoots (0 when within budget)
+    def budget_excess(self, estimate):
+        excess = (max(0, estimate['dsp'] - self.config.available_dsp) / self.config.available_dsp +
+                  max(0, estimate['bram'] - self.config.available_bram) / self.config.available_bram)
+        if self.config.target_fps is not None:
+            excess += max(0, self.config.target_fps - estimate['fps']) / self.config.target_fps
+        return excess
         
     def check_resource_constraints(self, model):
-        resources = model.get_resource_usage()
-        return (resources['dsp'] <= self.config.available_dsp and 
-                resources['bram'] <= self.config.available_bram)
-                
+        return self.budget_excess(self.estimate(model)) == 0
+        
+    # Greedy budget solver. Each round removes prune_step of one layer's
+    # channels (never going below min_channels): while the design is over
+    # budget, the step that reduces the overshoot most per unit of estimated
+    # accuracy loss; once it fits, the step that gains the most frames per
+    # second per unit of loss, as long as the total estimated loss stays
+    # within the loss budget (max_accuracy_loss, or max_taylor_loss for
+    # Taylor sensitivities). Within budget a layer is not pruned below
+    # measured_channels, since the sensitivity says nothing about steps past
+    # the one that was measured. Every round removes at least one channel, so
+    # the solver always terminates.
+    def solve_prune_rates(self, model, sensitivity_map, pruning_config, measured_channels=None):
+        channels = {name: layer.active_channels() for name, layer in model.layers.items()}
+        estimate = self.estimate(model, channels)
+        _, loss_budget = pruning_config.sensitivity_limits()
+        accuracy_loss = 0.0
+        
+        while True:
+            excess = self.budget_excess(estimate)
+            best = None
+            for name, layer in model.layers.items():
+                step = max(1, int(pruning_config.prune_step * layer.out_channels))
+                candidate = max(min(pruning_config.min_channels, channels[name]), channels[name] - step)
+                if candidate == channels[name]:
+                    continue
+                added_loss = max(sensitivity_map.get(name, 0.0), 0.0) * (channels[name] - candidate) / layer.out_channels
+                if excess == 0 and (accuracy_loss + added_loss > loss_budget or
+                                    measured_channels is not None and candidate < measured_channels.get(name, 0)):
+                    continue
+                trial = self.estimate(model, dict(channels, **{name: candidate}))
+                gain = excess - self.budget_excess(trial) if excess > 0 else trial['fps'] - estimate['fps']
+                score = gain / (added_loss + 1e-6)
+                if gain > 0 and (best is None or score > best[0]):
+                    best = (score, name, candidate, trial, added_loss)
+            if best is None:
+                break
+            _, name, channels[name], estimate, added_loss = best
+            accuracy_loss += added_loss
+        
+        return channels, estimate, accuracy_loss
+        
     def optimize_resource_allocation(self, model, pruning_manager):
-        while not self.check_resource_constraints(model):
-            # Find layer with lowest sensitivity
-            min_sensitivity_layer = min(pruning_manager.sensitivity_map.items(),
-                                     key=lambda x: x[1])[0]
-            # Prune that layer
-            model.layers[min_sensitivity_layer].prune_channels(
-                pruning_manager.config.prune_rate)
-                
+        channels, estimate, accuracy_loss = self.solve_prune_rates(
+            model, pruning_manager.sensitivity_map, pruning_manager.config, pruning_manager.measured_channels)
+        for name, layer in model.layers.items():
+            if channels[name] < layer.active_channels():
+                layer.prune_to(channels[name])
+        self.current_dsp, self.current_bram = estimate['dsp'], estimate['bram']
+        self.resource_table = dict(estimate, estimated_loss=accuracy_loss,
+                                   loss_units=pruning_manager.config.sensitivity_method,
+                                   within_budget=self.budget_excess(estimate) == 0)
+        return self.resource_table
+        
+def format_resource_table(table):
+    lines = [f"{'layer':<8}{'in':>6}{'out':>6}{'MMACs':>10}{'DSP':>7}{'BRAM':>7}{'latency (us)':>14}"]
+    for name, layer in table['layers'].items():
+        lines.append(f"{name:<8}{layer['in_channels']:>6}{layer['out_channels']:>6}{layer['macs'] / 1e6:>10.2f}"
+                     f"{layer['dsp']:>7}{layer['bram']:>7}{layer['latency'] * 1e6:>14.1f}")
+    lines.append(f"{'total':<8}{'':>6}{'':>6}{'':>10}{table['dsp']:>7}{table['bram']:>7}{table['latency'] * 1e6:>14.1f}")
+    lines.append(f"Estimated {table['fps']:.0f} FPS")
+    return "\n".join(lines)
+        
 # Bitstream Generator
 class BitstreamGenerator:
     def __init__(self):
@@ -191,6 +565,290 @@ class BitstreamGenerator:
             
         return json.dumps(self.configuration_words)
         
+    # Symmetric per-output-channel quantization of the masked weights;
+    # fp16 is stored as-is with unit scales
+    def quantize_weights(self, layer, weight_type):
+        weights = (layer.conv.weight.data * layer.mask).cpu().numpy().astype(np.float32)
+        dtype = WEIGHT_TYPES[weight_type][1]
+        if weight_type == 'fp16':
+            return weights.astype(dtype), np.ones(len(weights), dtype='<f4')
+        qmax = np.iinfo(dtype).max
+        max_abs = np.abs(weights.reshape(len(weights), -1)).max(axis=1)
+        scales = np.where(max_abs > 0, max_abs / qmax, 1.0).astype('<f4')
+        quantized = np.clip(np.rint(weights / scales[:, None, None, None]), -qmax, qmax).astype(dtype)
+        return quantized, scales
+        
+    # The table is laid out up front from the layer shapes, then each
+    # layer's blocks are quantized and streamed to the file in turn
+    def write_model_image(self, model, path, weight_type='int8'):
+        layers = list(model.layers.items())
+        code, dtype = WEIGHT_TYPES[weight_type]
+        table = np.zeros(len(layers), dtype=IMAGE_LAYER)
+        offset = align(IMAGE_HEADER.itemsize + table.nbytes)
+        for entry, (name, layer) in zip(table, layers):
+            count = layer.conv.weight.numel()
+            entry['name'] = name.encode()
+            entry['in_channels'], entry['out_channels'] = layer.in_channels, layer.out_channels
+            entry['kernel_size'], entry['stride'], entry['padding'] = layer.kernel_size, layer.stride, layer.padding
+            entry['weight_type'] = code
+            entry['weight_offset'], offset = offset, align(offset + count * dtype.itemsize)
+            entry['scale_offset'], offset = offset, align(offset + layer.out_channels * 4)
+            entry['bias_offset'], offset = offset, align(offset + layer.out_channels * 4)
+            entry['mask_nbytes'] = (count + 7) // 8
+            entry['mask_offset'], offset = offset, align(offset + int(entry['mask_nbytes']))
+        
+        header = np.zeros(1, dtype=IMAGE_HEADER)
+        header['magic'], header['version'], header['num_layers'] = IMAGE_MAGIC, 1, len(layers)
+        header['table_offset'] = IMAGE_HEADER.itemsize
+        with open(path, 'wb') as f:
+            f.write(header.tobytes())
+            f.write(table.tobytes())
+            for entry, (name, layer) in zip(table, layers):
+                weights, scales = self.quantize_weights(layer, weight_type)
+                bias = layer.conv.bias.data.cpu().numpy().astype('<f4')
+                mask = np.packbits(layer.mask.cpu().numpy().astype(bool).ravel(), bitorder='little')
+                for block_offset, block in ((entry['weight_offset'], weights), (entry['scale_offset'], scales),
+                                            (entry['bias_offset'], bias), (entry['mask_offset'], mask)):
+                    f.write(b'\0' * (int(block_offset) - f.tell()))
+                    f.write(block.tobytes())
+            f.write(b'\0' * (offset - f.tell()))
+        return offset
+        
+def align(offset):
+    return -(-offset // IMAGE_ALIGNMENT) * IMAGE_ALIGNMENT
+    
+# Opens a model image without reading it: every returned array is a view
+# into the memory map. Masks stay bit-packed; use unpack_mask to expand one.
+def load_model_image(path):
+    image = np.memmap(path, dtype=np.uint8, mode='r')
+    header = np.frombuffer(image, dtype=IMAGE_HEADER, count=1)[0]
+    if header['magic'] != IMAGE_MAGIC:
+        raise ValueError(f"{path} is not a model image")
+    table = np.frombuffer(image, dtype=IMAGE_LAYER, count=int(header['num_layers']),
+                          offset=int(header['table_offset']))
+    weight_dtypes = {code: dtype for code, dtype in WEIGHT_TYPES.values()}
+    layers = OrderedDict()
+    for entry in table:
+        shape = (int(entry['out_channels']), int(entry['in_channels']), int(entry['kernel_size']), int(entry['kernel_size']))
+        dtype = weight_dtypes[int(entry['weight_type'])]
+        layers[entry['name'].decode()] = {
+            'shape': shape,
+            'stride': int(entry['stride']),
+            'padding': int(entry['padding']),
+            'weights': np.frombuffer(image, dtype=dtype, count=int(np.prod(shape)), offset=int(entry['weight_offset'])).reshape(shape),
+            'scales': np.frombuffer(image, dtype='<f4', count=shape[0], offset=int(entry['scale_offset'])),
+            'bias': np.frombuffer(image, dtype='<f4', count=shape[0], offset=int(entry['bias_offset'])),
+            'mask': np.frombuffer(image, dtype=np.uint8, count=int(entry['mask_nbytes']), offset=int(entry['mask_offset']))
+        }
+    return layers
+    
+def unpack_mask(layer):
+    count = int(np.prod(layer['shape']))
+    return np.unpackbits(layer['mask'], count=count, bitorder='little').reshape(layer['shape'])
+    
+def dequantize_layer(layer):
+    return layer['weights'].astype(np.float32) * layer['scales'][:, None, None, None]
+    
+# Round trip: masks and biases must match exactly and weights to within half
+# a quantization step (fp16 rounding for fp16 images)
+def verify_model_image(model, path):
+    image = load_model_image(path)
+    if list(image) != list(model.layers):
+        raise AssertionError(f"Image layers {list(image)} do not match model layers {list(model.layers)}")
+    max_error = {}
+    for name, layer in model.layers.items():
+        entry = image[name]
+        expected = (layer.conv.weight.data * layer.mask).cpu().numpy()
+        if entry['shape'] != tuple(expected.shape):
+            raise AssertionError(f"{name}: shape {entry['shape']} != {tuple(expected.shape)}")
+        if not np.array_equal(unpack_mask(entry), layer.mask.cpu().numpy().astype(np.uint8)):
+            raise AssertionError(f"{name}: mask does not round-trip")
+        if not np.array_equal(entry['bias'], layer.conv.bias.data.cpu().numpy()):
+            raise AssertionError(f"{name}: bias does not round-trip")
+        error = np.abs(dequantize_layer(entry) - expected)
+        tolerance = (entry['scales'][:, None, None, None] / 2 if entry['weights'].dtype.kind == 'i'
+                     else np.abs(expected) * 2.0 ** -11)
+        if np.any(error > tolerance + 1e-7):
+            raise AssertionError(f"{name}: weights differ by up to {error.max()}")
+        max_error[name] = float(error.max())
+    return max_error
+    
+def compare_image_formats(model, path='fpga_configuration.bin', json_path='fpga_configuration.json',
+                          weight_type='int8'):
+    generator = BitstreamGenerator()
+    results = {}
+    start = time.perf_counter()
+    with open(json_path, 'w') as f:
+        f.write(generator.generate_model_bitstream(model))
+    results['json_write'] = time.perf_counter() - start
+    start = time.perf_counter()
+    with open(json_path) as f:
+        json.load(f)
+    results['json_load'] = time.perf_counter() - start
+    start = time.perf_counter()
+    generator.write_model_image(model, path, weight_type)
+    results['image_write'] = time.perf_counter() - start
+    start = time.perf_counter()
+    image = load_model_image(path)
+    for layer in image.values():
+        dequantize_layer(layer)
+    results['image_load'] = time.perf_counter() - start
+    results['json_bytes'] = os.path.getsize(json_path)
+    results['image_bytes'] = os.path.getsize(path)
+    return results
+    
+# Sparse Weight Encoding
+# Compressed sparse rows: row r's non-zeros are data[indptr[r]:indptr[r+1]]
+# at columns indices[indptr[r]:indptr[r+1]]
+class CSRMatrix:
+    def __init__(self, indptr, indices, data, shape):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = shape
+        
+    @classmethod
+    def from_dense(cls, dense):
+        dense = np.asarray(dense, dtype=np.float32)
+        rows, cols = np.nonzero(dense)
+        indptr = np.zeros(dense.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=dense.shape[0]), out=indptr[1:])
+        return cls(indptr, cols.astype(np.int32), dense[rows, cols], dense.shape)
+        
+    @property
+    def nnz(self):
+        return len(self.data)
+        
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + self.data.nbytes
+        
+    # self @ dense[n], for dense of shape (batch, columns, positions); only
+    # the non-zero weights are multiplied
+    def matmul(self, dense):
+        out = np.zeros((dense.shape[0], self.shape[0], dense.shape[2]), dtype=np.float32)
+        for row in range(self.shape[0]):
+            start, end = self.indptr[row], self.indptr[row + 1]
+            if start != end:
+                out[:, row] = np.einsum('k,nkp->np', self.data[start:end], dense[:, self.indices[start:end]])
+        return out
+        
+def im2col(x, kernel_size, stride=1, padding=0):
+    x = np.pad(x, ((0, 0), (0, 0), (padding, padding), (padding, padding)))
+    windows = np.lib.stride_tricks.sliding_window_view(x, (kernel_size, kernel_size), axis=(2, 3))
+    windows = windows[:, :, ::stride, ::stride]
+    batch, channels, out_height, out_width = windows.shape[:4]
+    columns = windows.transpose(0, 1, 4, 5, 2, 3).reshape(batch, channels * kernel_size * kernel_size, -1)
+    return columns, (out_height, out_width)
+    
+def dense_conv_reference(x, weight, bias, stride=1, padding=0):
+    columns, (out_height, out_width) = im2col(x, weight.shape[2], stride, padding)
+    out = np.matmul(weight.reshape(len(weight), -1), columns) + bias[:, None]
+    return out.reshape(len(x), len(weight), out_height, out_width)
+    
+# A pruned layer as the lists of output and input channels that survive
+# (structured pruning) plus the weights between them, kept as a dense block
+# or, when fewer than csr_density of them are non-zero, as CSR. forward()
+# only touches surviving channels and non-zero weights and returns the full
+# out_channels output with zeros in pruned channels, like the masked layer.
+class SparseConv2d:
+    def __init__(self, weight, bias, stride=1, padding=0, csr_density=0.5):
+        weight = np.asarray(weight, dtype=np.float32)
+        self.out_channels, self.in_channels, self.kernel_size = weight.shape[0], weight.shape[1], weight.shape[2]
+        self.stride = stride
+        self.padding = padding
+        self.output_channels = np.flatnonzero(np.any(weight, axis=(1, 2, 3)))
+        self.input_channels = np.flatnonzero(np.any(weight[self.output_channels], axis=(0, 2, 3)))
+        block = weight[np.ix_(self.output_channels, self.input_channels)].reshape(len(self.output_channels), -1)
+        self.bias = np.asarray(bias, dtype=np.float32)[self.output_channels]
+        self.density = np.count_nonzero(block) / max(block.size, 1)
+        self.csr = CSRMatrix.from_dense(block) if self.density < csr_density else None
+        self.block = None if self.csr is not None else block
+        
+    @classmethod
+    def from_layer(cls, layer, csr_density=0.5):
+        weight = (layer.conv.weight.data * layer.mask).cpu().numpy()
+        bias = (layer.conv.bias.data * layer.mask[:, 0, 0, 0]).cpu().numpy()
+        return cls(weight, bias, layer.stride, layer.padding, csr_density)
+        
+    @property
+    def encoding(self):
+        return 'csr' if self.csr is not None else 'channels'
+        
+    @property
+    def nnz(self):
+        return self.csr.nnz if self.csr is not None else int(np.count_nonzero(self.block))
+        
+    @property
+    def nbytes(self):
+        weights = self.csr.nbytes if self.csr is not None else self.block.nbytes
+        return weights + self.output_channels.nbytes + self.input_channels.nbytes + self.bias.nbytes
+        
+    def macs(self, out_height, out_width):
+        return self.nnz * out_height * out_width
+        
+    def forward(self, x):
+        columns, (out_height, out_width) = im2col(x[:, self.input_channels], self.kernel_size, self.stride, self.padding)
+        if self.csr is not None:
+            partial = self.csr.matmul(columns)
+        else:
+            partial = np.matmul(self.block, columns)
+        out = np.zeros((len(x), self.out_channels, out_height * out_width), dtype=np.float32)
+        out[:, self.output_channels] = partial + self.bias[:, None]
+        return out.reshape(len(x), self.out_channels, out_height, out_width)
+        
+def sparse_linear(csr, bias, x):
+    return csr.matmul(np.asarray(x, dtype=np.float32).T[None])[0].T + bias
+    
+# Speedup of the zero-skipping reference over the dense im2col reference
+# for one layer as its sparsity grows, either by pruning whole output
+# channels ('structured') or by zeroing the smallest individual weights
+# ('unstructured'). mac_speedup is the ideal speedup of hardware that skips
+# every zero weight.
+def benchmark_sparsity(in_channels=128, out_channels=256, size=8, batch_size=8,
+                       levels=(0.0, 0.25, 0.5, 0.75, 0.9, 0.95), repeats=5, seed=0):
+    torch.manual_seed(seed)
+    x = torch.randn(batch_size, in_channels, size, size)
+    results = []
+    for mode in ('structured', 'unstructured'):
+        for level in levels:
+            layer = ReconfigurableConv2d(in_channels, out_channels, 3, padding=1)
+            if mode == 'structured':
+                layer.prune_channels(level)
+            elif level > 0:
+                magnitude = layer.conv.weight.data.abs()
+                layer.mask = (magnitude > torch.quantile(magnitude.flatten(), level)).float()
+                layer.masked = True
+            with torch.no_grad():
+                expected = layer(x).numpy()
+            weight = (layer.conv.weight.data * layer.mask).numpy()
+            bias = (layer.conv.bias.data * layer.mask[:, 0, 0, 0]).numpy()
+            sparse = SparseConv2d.from_layer(layer)
+            inputs = x.numpy()
+            
+            timings = {}
+            for name, run in (('dense', lambda: dense_conv_reference(inputs, weight, bias, padding=1)),
+                              ('sparse', lambda: sparse.forward(inputs))):
+                run()
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    out = run()
+                timings[name] = (time.perf_counter() - start) / repeats
+                if np.abs(out - expected).max() > 1e-3:
+                    raise AssertionError(f"{name} reference differs from the masked layer at {mode} {level}")
+            results.append({
+                'mode': mode,
+                'sparsity': 1 - sparse.nnz / weight.size,
+                'encoding': sparse.encoding,
+                'mac_fraction': sparse.nnz / weight.size,
+                'mac_speedup': weight.size / max(sparse.nnz, 1),
+                'weight_bytes': sparse.nbytes,
+                'dense_time': timings['dense'],
+                'sparse_time': timings['sparse'],
+                'speedup': timings['dense'] / timings['sparse']
+            })
+    return results
+    
 # Main Training and Deployment Loop
 def main():
     # Initialize configurations
@@ -235,15 +893,22 @@ def main():
         # Periodic pruning and resource optimization
         if epoch % 10 == 0:
             pruning_manager.update_sensitivity_map(trainloader)
-            pruning_manager.prune_network()
+            pruning_manager.prune_network(trainloader)
             resource_manager.optimize_resource_allocation(model, pruning_manager)
             
-    # Generate final bitstream
-    bitstream = bitstream_generator.generate_model_bitstream(model)
+    # Drop the pruned channels before deployment
+    masked_latency = measure_latency(model)
+    masked_resources = model.get_resource_usage()
+    for name, channels in model.compact().items():
+        print(f"{name}: {channels['channels_before']} -> {channels['channels_after']} channels")
+    print(f"CPU latency: {masked_latency * 1e3:.2f} ms masked, {measure_latency(model) * 1e3:.2f} ms compacted")
+    print(f"Resources: {masked_resources} masked, {model.get_resource_usage()} compacted")
+    print(format_resource_table(resource_manager.estimate(model)))
     
-    # Save bitstream to file
-    with open('fpga_configuration.bit', 'w') as f:
-        f.write(bitstream)
+    # Write the final model image and check that it reads back
+    size = bitstream_generator.write_model_image(model, 'fpga_configuration.bin', weight_type='int8')
+    verify_model_image(model, 'fpga_configuration.bin')
+    print(f"Model image: {size / 1e6:.2f} MB")
         
 if __name__ == "__main__":
     main()
\ No newline at end of file